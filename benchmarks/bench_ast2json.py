@@ -0,0 +1,110 @@
+# Times ast2json and write_json against the dir()-based serializer they replaced, on python files.
+#   python benchmarks/bench_ast2json.py [--src path/to/src] [--dir folder] [--files 200] [--repeat 3]
+# Also checks that the default output is still the same text as the old one.
+import argparse
+import ast
+import codecs
+import glob
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+def legacy_ast2json(node):
+    # the previous implementation: every name of dir(node), recursive
+    to_return = {'_type': node.__class__.__name__}
+    for attr in dir(node):
+        if attr.startswith("_"):
+            continue
+        to_return[attr] = legacy_get_value(getattr(node, attr))
+    return to_return
+
+def legacy_get_value(attr_value):
+    if attr_value is None or isinstance(attr_value, (int, float, bool, str)):
+        return attr_value
+    if isinstance(attr_value, (bytearray, bytes)):
+        try:
+            return attr_value.decode('utf-8')
+        except:
+            return codecs.getencoder('hex_codec')(attr_value)[0].decode('utf-8')
+    if isinstance(attr_value, complex):
+        return str(attr_value)
+    if isinstance(attr_value, list):
+        return [legacy_get_value(x) for x in attr_value]
+    if isinstance(attr_value, ast.AST):
+        return legacy_ast2json(attr_value)
+    if isinstance(attr_value, type(Ellipsis)):
+        return '...'
+    raise Exception("unknown case for '%s' of type '%s'" % (attr_value, type(attr_value)))
+
+def load_trees(folder, count):
+    trees = []
+    for filepath in sorted(glob.glob(os.path.join(folder, "**", "*.py"), recursive=True)):
+        if len(trees) >= count:
+            break
+        try:
+            with open(filepath, 'rb') as f:
+                trees.append(ast.parse(f.read()))
+        except (SyntaxError, ValueError, OSError):
+            continue
+    return trees
+
+def variants(ast2json, write_json):
+    # name: serializes a tree to a JSON string
+    def written(**options):
+        def run(tree):
+            out = io.StringIO()
+            write_json(tree, out, **options)
+            return out.getvalue()
+        return run
+    return {
+        "legacy dumps": lambda tree: json.dumps(legacy_ast2json(tree)),
+        "ast2json dumps": lambda tree: json.dumps(ast2json(tree)),
+        "write_json": written(),
+        "write_json compact": written(compact=True),
+        "  no positions": written(compact=True, positions=False),
+        "  Call/FunctionDef": written(compact=True, positions=False, node_types={"Call", "FunctionDef"}),
+        "  max_depth 3": written(compact=True, max_depth=3),
+    }
+
+def bench(run, trees, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = sum(len(run(tree)) for tree in trees)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    peak = 0
+    for tree in trees:
+        run(tree)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    tracemalloc.stop()
+    return best, size, peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark ast2json against the previous implementation")
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    parser.add_argument("--dir", default=os.path.dirname(os.__file__), help="folder with the python files to serialize")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.src)
+    from ast2json import ast2json, write_json
+
+    trees = load_trees(args.dir, args.files)
+    runs = variants(ast2json, write_json)
+    for tree in trees:
+        if not (runs["legacy dumps"](tree) == runs["ast2json dumps"](tree) == runs["write_json"](tree)):
+            print("MISMATCH with the legacy output")
+            sys.exit(1)
+
+    print(f"{len(trees)} files")
+    print(f"{'variant':<22} {'seconds':>10} {'MB out':>8} {'peak KB':>10}")
+    for name, run in runs.items():
+        elapsed, size, peak = bench(run, trees, args.repeat)
+        print(f"{name:<22} {elapsed:>10.4f} {size / 1e6:>8.2f} {peak // 1024:>10}")
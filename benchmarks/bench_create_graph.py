@@ -0,0 +1,65 @@
+# Times graph_from_edges on synthetic call graphs of growing size.
+#   python benchmarks/bench_create_graph.py [--src path/to/src] [--sizes 250 500 1000 2000] [--shape diamond] [--max-depth 3]
+import argparse
+import os
+import sys
+import time
+
+def node(module, func_name):
+    return {"module": module, "file": f"/project/{module}.py", "func_name": func_name}
+
+def make_nodes(node_count, modules=25, fanout=4, attribute_share=4):
+    # every function calls the next `fanout` functions, and every `attribute_share`-th
+    # function also calls another module's leaf. Returns the start node and the edges by function name
+    per_module = max(1, node_count // modules)
+    funcs = [node(f"mod{i // per_module}", f"func{i}") for i in range(node_count)]
+    leaves = [node(f"mod{m}", f"leaf{m}") for m in range(modules)]
+    edges = {n["func_name"]: [] for n in funcs + leaves}
+    for i in range(node_count):
+        for j in range(1, fanout + 1):
+            if i + j < node_count:
+                edges[f"func{i}"].append(("call", funcs[i + j], j))
+        if i % attribute_share == 0:
+            edges[f"func{i}"].append(("call", leaves[(i // per_module + 1) % modules], fanout + 1))
+    return funcs[0], edges
+
+def make_diamond(node_count):
+    # levels of two functions, both calling both functions of the next level,
+    # every function can be reached through 2^level paths
+    levels = max(1, node_count // 2)
+    nodes = [[node("mod0", f"level{level}_{k}") for k in range(2)] for level in range(levels)]
+    start = node("mod0", "func0")
+    edges = {"func0": [("call", nodes[0][0], 1)]}
+    for level in range(levels):
+        for k in range(2):
+            edges[f"level{level}_{k}"] = [("call", nodes[level + 1][j], j + 1) for j in range(2)] if level + 1 < levels else []
+    return start, edges
+
+SHAPES = {"fanout": make_nodes, "diamond": make_diamond}
+
+def bench(graph_from_edges, node_count, repeat, shape="fanout", max_depth=None):
+    best = None
+    for _ in range(repeat):
+        (start_node, edges) = SHAPES[shape](node_count)
+        start = time.perf_counter()
+        graph = graph_from_edges(start_node, lambda n: edges[n["func_name"]], max_depth=max_depth)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(graph["edges"])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark graph_from_edges against the number of nodes")
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 2000, 4000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="fanout")
+    parser.add_argument("--max-depth", type=int, default=None, help="limit the walk like a first paint would")
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.src)
+    from create_graph import graph_from_edges
+
+    print(f"{'nodes':>8} {'edges':>8} {'seconds':>10}")
+    for size in args.sizes:
+        elapsed, edges = bench(graph_from_edges, size, args.repeat, args.shape, args.max_depth)
+        print(f"{size:>8} {edges:>8} {elapsed:>10.4f}")
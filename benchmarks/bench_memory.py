@@ -0,0 +1,57 @@
+# Measures the memory the call graph of a large generated project keeps, apart from the module summaries.
+#   python benchmarks/bench_memory.py [--src path/to/src] [--modules 600] [--functions 20]
+# Run it with the --src of another checkout to compare both.
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def traced(build):
+    # the memory still held by what build returns, and the peak while building it
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the memory of the project call graph")
+    parser.add_argument("--src", default=os.path.join(HERE, "..", "src"))
+    parser.add_argument("--modules", type=int, default=600)
+    parser.add_argument("--functions", type=int, default=20, help="functions per module")
+    parser.add_argument("--fanout", type=int, default=4, help="calls per function")
+    parser.add_argument("--routes", type=int, default=500, help="size of the route table")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.src))
+    sys.path.insert(0, os.path.join(HERE, "pipeline"))
+    import walk_from_func as wf
+    from generate import generate_project
+
+    with tempfile.TemporaryDirectory() as root:
+        project = generate_project(root, modules=args.modules, functions=args.functions, fanout=args.fanout, depth=8, routes=args.routes)
+        routes = wf.parse_routes(project["routes"])
+        wf.proj_path = root
+        files = [os.path.join(dirpath, f) for (dirpath, _, filenames) in os.walk(root) for f in filenames if f.endswith(".py")]
+        _, summaries, _ = traced(lambda: wf.load_summaries(files))
+
+        start = time.perf_counter()
+        graph, held, peak = traced(lambda: wf.ProjectGraph(root, routes, wf.get_resolver(), wf.load_summary))
+        elapsed = time.perf_counter() - start
+        functions = sum(len(defs) for defs in graph.defs.values())
+        flow = project["flows"][0]
+        nodes = len(wf.analyse_project_flow(flow["file"], flow["func"], routes)["graph"]["nodes"])
+
+    print(f"{len(files)} modules, {functions} functions, first flow {nodes} nodes")
+    print(f"summaries        {summaries / 1e6:>8.2f} MB")
+    print(f"call graph       {held / 1e6:>8.2f} MB  {held / functions:>6.0f} B per function")
+    print(f"peak building it {peak / 1e6:>8.2f} MB  ({elapsed:.1f}s traced)")
+    print(json.dumps({"summaries_bytes": summaries, "graph_bytes": held, "graph_peak_bytes": peak, "functions": functions}))
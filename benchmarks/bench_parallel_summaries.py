@@ -0,0 +1,61 @@
+# Times building the project call graph of a synthetic project with 1, 2, 4 and 8 worker processes,
+# and checks that every worker count gives the same summaries and graph as the serial run.
+#   python benchmarks/bench_parallel_summaries.py [--src path/to/src] [--modules 400] [--jobs 1 2 4 8]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+def write_project(root, modules, funcs_per_module=20, statements=5):
+    for m in range(modules):
+        lines = ["import os", "import requests", f"import mod{(m + 1) % modules}", ""]
+        for f in range(funcs_per_module):
+            lines.append(f"def func{f}(x, y=None):")
+            for s in range(statements):
+                lines.append(f"    v{s} = os.path.join(str(x), 'part{s}', y or '') if x else [{s}, x, y]")
+            if f + 1 < funcs_per_module:
+                lines.append(f"    func{f + 1}(x)")
+            lines.append(f"    mod{(m + 1) % modules}.func{f}(x)")
+            lines.append(f"    return requests.get('/items/' + str(x))")
+            lines.append("")
+        with open(os.path.join(root, f"mod{m}.py"), 'w') as f:
+            f.write('\n'.join(lines))
+
+def bench(walk_from_func, root, jobs):
+    # a fresh cache every time, so all modules are summarized
+    walk_from_func.invalidate()
+    walk_from_func.project_graphs.clear()
+    walk_from_func.shutdown_executor()
+    walk_from_func.jobs = jobs
+    # start the workers before timing, a server keeps them between requests
+    if walk_from_func.get_executor() is not None:
+        list(walk_from_func.get_executor().map(abs, range(jobs)))
+    start = time.perf_counter()
+    output = walk_from_func.analyse_project_flow(os.path.join(root, "mod0.py"), "func0", walk_from_func.parse_routes([]))
+    elapsed = time.perf_counter() - start
+    summaries = {f: walk_from_func.module_cache.memory[f][2] for f in walk_from_func.module_cache.memory}
+    return elapsed, output["graph"], summaries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark parallel module summarization")
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    parser.add_argument("--modules", type=int, default=400)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.src)
+    import walk_from_func
+
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'jobs':>6} {'seconds':>10} {'speedup':>8} {'same':>6}")
+    with tempfile.TemporaryDirectory() as root:
+        write_project(root, args.modules)
+        serial = None
+        for jobs in args.jobs:
+            elapsed, graph, summaries = bench(walk_from_func, root, jobs)
+            if serial is None:
+                serial = (elapsed, graph, summaries)
+            same = graph == serial[1] and summaries == serial[2]
+            print(f"{jobs:>6} {elapsed:>10.3f} {serial[0] / elapsed:>8.2f} {str(same):>6}")
+        walk_from_func.shutdown_executor()
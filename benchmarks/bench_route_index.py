@@ -0,0 +1,64 @@
+# Times RouteIndex.match against the number of routes, and checks that endpoints with variable
+# parts like requests.get(base + id) are looked up in the trie: their route comparisons must not
+# grow with the number of routes.
+#   python benchmarks/bench_route_index.py [--src path/to/src] [--sizes 100 1000 10000]
+import argparse
+import os
+import re
+import sys
+import time
+
+def make_routes(route_count):
+    # /api/r<i>/<id>/ and /api/r<i>/items/ routes, with GET and POST
+    routes = []
+    for i in range(route_count):
+        routes.append({"name": f"/api/r{i}/<id>/", "methods": ["GET"], "route_pattern": "ccv"})
+        routes.append({"name": f"/api/r{i}/items/", "methods": ["GET", "POST"], "route_pattern": "ccc"})
+    return routes
+
+def make_calls(route_count, call_count=1000):
+    # ("METHOD", "endpoint regex", "cv pattern") of requests.* calls, as module_summary detects them
+    step = max(1, route_count // call_count)
+    return [("GET", f"/api/r{i}/([^/]+)/", "ccv") for i in range(0, route_count, step)]
+
+def linear_match(routes, method, endpoint, pattern):
+    regex = re.compile(endpoint)
+    for route in routes:
+        if method in route["methods"] and route["route_pattern"] == pattern and regex.match(route["name"]):
+            return route
+    return None
+
+def bench(RouteIndex, instrumentation, route_count):
+    routes = make_routes(route_count)
+    calls = make_calls(route_count)
+    start = time.perf_counter()
+    index = RouteIndex(routes)
+    build = time.perf_counter() - start
+    instrumentation.reset()
+    start = time.perf_counter()
+    matched = [index.match(*call) for call in calls]
+    elapsed = time.perf_counter() - start
+    comparisons = instrumentation.counters["route_comparisons"] / len(calls)
+    for call, route in zip(calls, matched):
+        assert route is linear_match(routes, *call), f"{call} matched {route}"
+    return build, elapsed, comparisons
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark route matching against the number of routes")
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.src)
+    from instrumentation import instrumentation
+    from route_index import RouteIndex
+    instrumentation.enabled = True
+
+    print(f"{'routes':>8} {'build s':>10} {'match s':>10} {'comparisons/call':>18}")
+    per_call = []
+    for size in args.sizes:
+        build, elapsed, comparisons = bench(RouteIndex, instrumentation, size)
+        per_call.append(comparisons)
+        print(f"{size:>8} {build:>10.4f} {elapsed:>10.4f} {comparisons:>18.1f}")
+    # the trie looks up one node per segment, whatever the number of routes
+    assert max(per_call) == min(per_call), "variable endpoints aren't matched through the trie"
@@ -0,0 +1,68 @@
+# Benchmarks the analysis pipeline on a generated project and compares the results with a baseline.
+#   python benchmarks/pipeline --output results.json
+#   python benchmarks/pipeline --baseline results.json [--tolerance 0.25]
+# Exits with 1 when the results regress against the baseline.
+import argparse
+import json
+import os
+import sys
+import tempfile
+from generate import DEFAULTS, IMPORT_STYLES, generate_project
+from harness import STAGES, compare, run_pipeline
+
+def project_files(root):
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        files += [os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith(".py")]
+    return sorted(files)
+
+def print_results(results):
+    print(f"{'stage':<14} {'seconds':>10} {'peak KB':>10} {'parse':>7} {'find_spec':>10}")
+    for name, metrics in results["stages"].items():
+        print(f"{name:<14} {metrics['wall_s']:>10.4f} {metrics['peak_bytes'] // 1024:>10} {metrics['parse_calls']:>7} {metrics['find_spec_calls']:>10}")
+    for kind, size in results["graphs"].items():
+        print(f"{kind} graphs: {size['nodes']} nodes, {size['edges']} edges")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on a synthetic project")
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+    parser.add_argument("--modules", type=int, default=DEFAULTS["modules"])
+    parser.add_argument("--functions", type=int, default=DEFAULTS["functions"], help="functions per module")
+    parser.add_argument("--fanout", type=int, default=DEFAULTS["fanout"], help="calls per function")
+    parser.add_argument("--depth", type=int, default=DEFAULTS["depth"], help="layers of modules")
+    parser.add_argument("--import-styles", nargs="+", choices=IMPORT_STYLES, default=DEFAULTS["import_styles"])
+    parser.add_argument("--request-share", type=float, default=DEFAULTS["request_share"], help="share of requests.* calls")
+    parser.add_argument("--routes", type=int, default=DEFAULTS["routes"], help="size of the route table")
+    parser.add_argument("--flows", type=int, default=DEFAULTS["flows"])
+    parser.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=None, help="only run these stages")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best time is reported")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative increase of time and memory")
+    parser.add_argument("--project-dir", default=None, help="generate the project here instead of a temporary folder")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.src))
+    import walk_from_func
+
+    params = {key: getattr(args, key) for key in DEFAULTS}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.abspath(args.project_dir or tmp)
+        project = generate_project(root, **params)
+        project["files"] = project_files(root)
+        results = {"params": params, "python": sys.version.split()[0]}
+        results.update(run_pipeline(walk_from_func, project, args.stages, args.repeat))
+
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print("no regressions against the baseline")
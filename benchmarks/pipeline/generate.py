@@ -0,0 +1,129 @@
+# Generates synthetic python projects for the pipeline benchmarks.
+#
+# root/main.py holds the flow functions, they call into the package root/app, whose modules are
+# split into `depth` layers. Every function makes `fanout` calls: a share of them are requests.*
+# calls to the route table, the others call functions of the next layer, imported with one of
+# the import styles. Everything is derived from the seed, so the same parameters give the same project.
+import json
+import os
+import random
+
+IMPORT_STYLES = ["import", "from", "alias", "relative"]
+
+DEFAULTS = {
+    "modules": 100,
+    "functions": 10, # per module
+    "fanout": 3, # calls per function
+    "depth": 5, # layers of modules between the flows and the leaves
+    "import_styles": ["import", "from", "relative"],
+    "request_share": 0.1, # share of the calls which are requests.get/post calls
+    "routes": 200, # size of the route table
+    "flows": 5,
+    "seed": 0,
+}
+
+def func_name(module, index):
+    # unique over the project, the nodes of a graph are keyed by function name
+    return f"m{module}_f{index}"
+
+def make_routes(root, params):
+    routes = []
+    for k in range(params["routes"]):
+        handler = k % params["modules"]
+        route = {
+            "module": f"app.mod{handler}",
+            "file": os.path.join(root, "app", f"mod{handler}.py"),
+            "func_name": func_name(handler, k % params["functions"]),
+            "lineno": 1,
+        }
+        if k % 2 == 0:
+            route.update({"name": f"/api/r{k}/<id>", "methods": ["GET"], "route_pattern": "ccv"})
+        else:
+            route.update({"name": f"/api/r{k}/items", "methods": ["POST"], "route_pattern": "ccc"})
+        routes.append(route)
+    return routes
+
+def request_call(rnd, params):
+    k = rnd.randrange(params["routes"]) if params["routes"] else 0
+    if k % 2 == 0:
+        return f'requests.get("/api/r{k}/" + x)'
+    return f'requests.post("/api/r{k}/items")'
+
+class ModuleWriter:
+    # collects the imports a module needs for its calls into other modules
+    def __init__(self, style, in_package):
+        self.style = style
+        self.in_package = in_package
+        self.imports = [] # ["import line"]
+        self.from_imports = dict() # {"module": ["name"]}
+
+    def call(self, module, index):
+        name = func_name(module, index)
+        style = self.style if self.in_package or self.style != "relative" else "from"
+        if style == "import":
+            self._add(f"import app.mod{module}")
+            return f"app.mod{module}.{name}(x)"
+        if style == "alias":
+            self._add(f"import app.mod{module} as mod{module}")
+            return f"mod{module}.{name}(x)"
+        source = f".mod{module}" if style == "relative" else f"app.mod{module}"
+        names = self.from_imports.setdefault(source, [])
+        if name not in names:
+            names.append(name)
+        return f"{name}(x)"
+
+    def _add(self, line):
+        if line not in self.imports:
+            self.imports.append(line)
+
+    def header(self):
+        lines = ["import requests"] + self.imports
+        lines += [f"from {source} import {', '.join(names)}" for (source, names) in self.from_imports.items()]
+        return lines
+
+def write_functions(rnd, params, writer, names, next_layer):
+    lines = []
+    for name in names:
+        lines += ["", "", f"def {name}(x):"]
+        for _ in range(params["fanout"]):
+            if rnd.random() < params["request_share"] or not next_layer:
+                lines.append(f"    {request_call(rnd, params)}")
+            else:
+                module = rnd.choice(next_layer)
+                lines.append(f"    {writer.call(module, rnd.randrange(params['functions']))}")
+        lines.append("    return x")
+    return lines
+
+def generate_project(root, **params):
+    # writes the project below root and returns the flows to analyse and the route table
+    params = {**DEFAULTS, **params}
+    rnd = random.Random(params["seed"])
+    styles = params["import_styles"]
+    modules = params["modules"]
+    depth = max(1, min(params["depth"], modules))
+    layers = [[m for m in range(modules) if m * depth // modules == layer] for layer in range(depth)]
+
+    package = os.path.join(root, "app")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, "__init__.py"), 'w') as f:
+        f.write("")
+    for layer, layer_modules in enumerate(layers):
+        next_layer = layers[layer + 1] if layer + 1 < depth else []
+        for m in layer_modules:
+            writer = ModuleWriter(styles[m % len(styles)], True)
+            names = [func_name(m, i) for i in range(params["functions"])]
+            body = write_functions(rnd, params, writer, names, next_layer)
+            with open(os.path.join(package, f"mod{m}.py"), 'w') as f:
+                f.write('\n'.join(writer.header() + body) + '\n')
+
+    writer = ModuleWriter(styles[0], False)
+    names = [f"flow{k}" for k in range(params["flows"])]
+    body = write_functions(rnd, params, writer, names, layers[0])
+    main = os.path.join(root, "main.py")
+    with open(main, 'w') as f:
+        f.write('\n'.join(writer.header() + body) + '\n')
+
+    routes = make_routes(root, params)
+    with open(os.path.join(root, "routes.json"), 'w') as f:
+        json.dump(routes, f)
+    return {"flows": [{"file": main, "func": name} for name in names], "routes": routes}
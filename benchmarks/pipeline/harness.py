@@ -0,0 +1,131 @@
+# Runs the analysis pipeline of walk_from_func on a generated project, end to end and stage by stage.
+# Every stage reports its best wall time, and from one extra run under tracemalloc its peak memory
+# and how often ast.parse and ModuleResolver.find_spec were called.
+import ast
+import contextlib
+import io
+import time
+import tracemalloc
+
+class CallCounter:
+    # counts the calls of owner.name while active
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+        self.count = 0
+
+    def __enter__(self):
+        self.original = getattr(self.owner, self.name)
+        def counted(*args, **kwargs):
+            self.count += 1
+            return self.original(*args, **kwargs)
+        setattr(self.owner, self.name, counted)
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.owner, self.name, self.original)
+
+def cold(wf, project):
+    # no summaries, resolved modules or project graphs left from an earlier run
+    wf.invalidate()
+
+def warm(wf, project):
+    cold(wf, project)
+    for flow in project["flows"]:
+        wf.crawl_flow(flow["file"], flow["func"], project["route_index"])
+
+def run_ast2json(wf, project):
+    from ast2json import ast2json
+    for filepath in project["files"]:
+        with open(filepath, 'rb') as f:
+            ast2json(ast.parse(f.read()))
+
+def run_summarize(wf, project):
+    from module_summary import summarize_module
+    wf.module_cache.get_many(project["files"], summarize_module)
+
+def run_crawl(wf, project):
+    return [wf.crawl_flow(flow["file"], flow["func"], project["route_index"]) for flow in project["flows"]]
+
+def run_flow_graph(wf, project):
+    return [crawl.flow_graph(wf.flow_project(flow["file"])[1], flow["func"]) for flow, crawl in zip(project["flows"], project["crawled"])]
+
+def run_lets_go(wf, project):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for flow in project["flows"]:
+            wf.lets_go(flow["file"], flow["func"], routes=project["routes"])
+    return output.getvalue()
+
+def run_project_graph(wf, project):
+    return [wf.analyse_project_flow(flow["file"], flow["func"], project["route_index"])["graph"] for flow in project["flows"]]
+
+# name: (prepare, run), in pipeline order
+STAGES = {
+    "ast2json": (cold, run_ast2json),
+    "summarize": (cold, run_summarize),
+    "crawl": (warm, run_crawl),
+    "flow_graph": (warm, run_flow_graph),
+    "lets_go": (cold, run_lets_go),
+    "project_graph": (cold, run_project_graph),
+}
+
+def measure(wf, project, prepare, run, repeat):
+    from module_resolver import ModuleResolver
+    best = None
+    for _ in range(repeat):
+        prepare(wf, project)
+        start = time.perf_counter()
+        run(wf, project)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    prepare(wf, project)
+    with CallCounter(ast, "parse") as parses, CallCounter(ModuleResolver, "find_spec") as specs:
+        tracemalloc.start()
+        result = run(wf, project)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"wall_s": best, "peak_bytes": peak, "parse_calls": parses.count, "find_spec_calls": specs.count}, result
+
+def graph_size(graphs):
+    return {"nodes": sum(len(g["nodes"]) for g in graphs), "edges": sum(len(g["edges"]) for g in graphs)}
+
+def run_pipeline(wf, project, stages=None, repeat=3):
+    # project: {"flows": [{"file", "func"}], "routes": [...], "files": ["module files"]}
+    project = dict(project, route_index=wf.parse_routes(project["routes"]))
+    warm(wf, project)
+    project["crawled"] = run_crawl(wf, project)
+    results = {"stages": dict(), "graphs": dict()}
+    for name, (prepare, run) in STAGES.items():
+        if stages is not None and name not in stages:
+            continue
+        results["stages"][name], output = measure(wf, project, prepare, run, repeat)
+        if name == "flow_graph":
+            results["graphs"]["crawl"] = graph_size(output)
+        elif name == "project_graph":
+            results["graphs"]["project"] = graph_size(output)
+    return results
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.005):
+    # the regressions of results against the baseline: more time or memory than the tolerance
+    # allows, more parse/find_spec calls, or graphs of another size
+    problems = []
+    if results.get("params") != baseline.get("params"):
+        problems.append("the project parameters differ from the baseline's")
+    for stage, old in baseline["stages"].items():
+        new = results["stages"].get(stage)
+        if new is None:
+            continue
+        if new["wall_s"] > old["wall_s"] * (1 + tolerance) and new["wall_s"] - old["wall_s"] > min_seconds:
+            problems.append(f"{stage}: wall time {old['wall_s']:.4f}s -> {new['wall_s']:.4f}s")
+        if new["peak_bytes"] > old["peak_bytes"] * (1 + tolerance):
+            problems.append(f"{stage}: peak memory {old['peak_bytes']} -> {new['peak_bytes']} bytes")
+        for key in ("parse_calls", "find_spec_calls"):
+            if new[key] > old[key]:
+                problems.append(f"{stage}: {key} {old[key]} -> {new[key]}")
+    for kind, old in baseline.get("graphs", dict()).items():
+        new = results["graphs"].get(kind)
+        if new is not None and new != old:
+            problems.append(f"{kind} graphs: {old} -> {new}")
+    return problems
@@ -0,0 +1,125 @@
+import * as child_process from "child_process";
+import { LooseObject } from "./extension";
+
+interface PendingRequest {
+  resolve: (response: LooseObject) => void;
+  reject: (reason: any) => void;
+}
+
+// Long-running walk_from_func.py process answering line-delimited JSON requests,
+// so that modules are resolved and parsed once for all the flows
+export class AnalysisServer {
+  private _process: child_process.ChildProcessWithoutNullStreams | undefined;
+  private _pending = new Map<number, PendingRequest>();
+  private _nextId = 0;
+  private _buffer = "";
+  // {routes: [...]} or {index: "path"} of the routes request
+  private _routes: LooseObject = { routes: [] };
+
+  constructor(
+    private readonly _pythonPath: string,
+    private readonly _scriptPath: string,
+    private readonly _args: string[] = [],
+  ) { }
+
+  private _start() {
+    const pythonProcess = child_process.spawn(this._pythonPath, [this._scriptPath, "--server", ...this._args]);
+
+    pythonProcess.stdout.on("data", (data: any) => {
+      this._buffer += data.toString();
+      let newline;
+      while ((newline = this._buffer.indexOf("\n")) !== -1) {
+        const line = this._buffer.slice(0, newline).trim();
+        this._buffer = this._buffer.slice(newline + 1);
+        if (line.length) {
+          this._onResponse(line);
+        }
+      }
+    });
+
+    pythonProcess.stderr.on("data", (data: any) => {
+      console.error(`Python Script Error: ${data}`);
+    });
+
+    pythonProcess.on("error", (error: any) => {
+      this._rejectAll(`Python analysis server failed: ${error}`);
+    });
+
+    pythonProcess.on("close", (code: any) => {
+      this._process = undefined;
+      this._buffer = "";
+      this._rejectAll(`Python analysis server exited with code ${code}`);
+    });
+
+    this._process = pythonProcess;
+    // routes are loaded once per process, responses to internal requests are ignored
+    this._send({ cmd: "routes", ...this._routes, id: -1 });
+  }
+
+  private _send(message: LooseObject) {
+    this._process?.stdin.write(JSON.stringify(message) + "\n");
+  }
+
+  private _onResponse(line: string) {
+    let response: LooseObject;
+    try {
+      response = JSON.parse(line);
+    } catch {
+      console.error(`Invalid python output: ${line}`);
+      return;
+    }
+    const pending = this._pending.get(response.id);
+    if (pending === undefined) {
+      return;
+    }
+    this._pending.delete(response.id);
+    if (response.error !== undefined) {
+      pending.reject(response.error);
+    } else {
+      pending.resolve(response);
+    }
+  }
+
+  private _rejectAll(reason: string) {
+    for (const pending of this._pending.values()) {
+      pending.reject(reason);
+    }
+    this._pending.clear();
+  }
+
+  public setRoutes(routes: LooseObject[], reload: boolean = false) {
+    this._loadRoutes({ routes: routes }, reload);
+  }
+
+  // the routes are read from a project index written by project_index.py
+  public setIndex(indexPath: string, reload: boolean = false) {
+    this._loadRoutes({ index: indexPath }, reload);
+  }
+
+  private _loadRoutes(routes: LooseObject, reload: boolean) {
+    this._routes = routes;
+    if (this._process !== undefined) {
+      // drop all warm state on reload, files might have changed since the last analysis
+      this._send({ cmd: reload ? "reload" : "routes", ...routes, id: -1 });
+    }
+  }
+
+  public request(message: LooseObject): Promise<LooseObject> {
+    if (this._process === undefined) {
+      this._start();
+    }
+    const id = this._nextId++;
+    return new Promise((resolve, reject) => {
+      this._pending.set(id, { resolve: resolve, reject: reject });
+      this._send({ ...message, id: id });
+    });
+  }
+
+  public dispose() {
+    if (this._process !== undefined) {
+      this._process.stdin.end(JSON.stringify({ cmd: "shutdown" }) + "\n");
+      this._process = undefined;
+    }
+    this._rejectAll("Python analysis server stopped");
+  }
+}
@@ -25,12 +25,17 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from _ast import AST
 from ast import parse
+from json.encoder import encode_basestring_ascii
 import codecs
+import json
 
 BUILTIN_PURE = (int, float, bool)
 BUILTIN_BYTES = (bytearray, bytes)
 BUILTIN_STR = (str)
 
+# chunks collected before they are written to the stream
+WRITE_BATCH = 4096
+
 
 def decode_str(value):
     return value
@@ -43,19 +48,185 @@ def decode_bytes(value):
         return codecs.getencoder('hex_codec')(value)[0].decode('utf-8')
 
 
-def ast2json(node):
+class Projection:
+    # What is written out of a tree:
+    #   positions: keep lineno/col_offset/end_lineno/end_col_offset
+    #   node_types: {"Call", ...} only keep nodes of these types, whole, and the nodes on the way to
+    #     them, with their plain values but only the fields leading to kept nodes. None keeps all
+    #   max_depth: nodes more than max_depth levels below the root are cut to {"_type": ...}
+    #   compact: leave out None and [] values and the deprecated aliases like Constant.n
+    # The defaults give the same output as iterating dir(node).
+    def __init__(self, root, positions=True, node_types=None, max_depth=None, compact=False):
+        self.positions = positions
+        self.node_types = node_types
+        self.max_depth = max_depth
+        self.compact = compact
+        self.layouts = dict() # {node class: ["attribute"]}
+        # ids of the nodes which are or lead to nodes of node_types
+        self.kept = kept_nodes(root, node_types) if node_types is not None else None
+
+    def layout(self, cls):
+        layout = self.layouts.get(cls)
+        if layout is None:
+            layout = set(cls._fields)
+            if self.positions:
+                layout.update(cls._attributes)
+            if not self.compact:
+                # aliases of the fields, e.g. Constant.n and Tuple.dims
+                layout.update(name for name in dir(cls) if not name.startswith('_') and name not in cls._attributes)
+            # dir() lists the attributes sorted
+            layout = sorted(layout)
+            self.layouts[cls] = layout
+        return layout
+
+    def items(self, node, whole):
+        # (key, value) of the node's fields, whole: the node is inside a node of node_types
+        for key in self.layout(node.__class__):
+            value = getattr(node, key, None)
+            if self.kept is not None and not whole:
+                if isinstance(value, AST):
+                    if id(value) not in self.kept:
+                        continue
+                elif isinstance(value, list) and any(isinstance(v, AST) for v in value):
+                    value = [v for v in value if not isinstance(v, AST) or id(v) in self.kept]
+                    if not any(isinstance(v, AST) for v in value):
+                        continue
+            if self.compact and (value is None or value == []):
+                continue
+            yield key, value
+
+    def is_whole(self, node, whole):
+        return whole or self.kept is None or node.__class__.__name__ in self.node_types
+
+    def is_cut(self, depth):
+        return self.max_depth is not None and depth > self.max_depth
+
+
+def kept_nodes(root, node_types):
+    # post order without recursion: a node is kept if it has a node type or a kept child
+    kept = set()
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in child_nodes(node))
+            continue
+        if node.__class__.__name__ in node_types or any(id(child) in kept for child in child_nodes(node)):
+            kept.add(id(node))
+    return kept
+
+
+def child_nodes(node):
+    for name in node._fields:
+        value = getattr(node, name, None)
+        if isinstance(value, AST):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, AST):
+                    yield item
+
+
+def ast2json(node, positions=True, node_types=None, max_depth=None, compact=False):
+    # the tree as nested dicts, built without recursion so deep trees can't overflow the stack
     assert isinstance(node, AST)
-    to_return = dict()
-    to_return['_type'] = node.__class__.__name__
-    for attr in dir(node):
-        if attr.startswith("_"):
+    projection = Projection(node, positions, node_types, max_depth, compact)
+    root = dict()
+    stack = [(node, root, 0, False)] # (node, its dict, depth, whole)
+    while stack:
+        node, to_return, depth, whole = stack.pop()
+        to_return['_type'] = node.__class__.__name__
+        if projection.is_cut(depth):
             continue
-        to_return[attr] = get_value(getattr(node, attr))
-    return to_return
+        whole = projection.is_whole(node, whole)
+        for (key, value) in projection.items(node, whole):
+            to_return[key] = convert(value, stack, depth + 1, whole)
+    return root
+
+
+def convert(value, stack, depth, whole):
+    # plain values are converted, nodes get an empty dict which is filled when they are popped
+    if isinstance(value, AST):
+        child = dict()
+        stack.append((value, child, depth, whole))
+        return child
+    if isinstance(value, list):
+        return [convert(v, stack, depth, whole) for v in value]
+    if isinstance(value, dict):
+        return {k: convert(v, stack, depth, whole) for (k, v) in value.items()}
+    return get_value(value)
+
+
+def write_json(node, stream, positions=True, node_types=None, max_depth=None, compact=False):
+    # writes the tree's JSON to stream while walking it, the same text as json.dumps(ast2json(node)),
+    # compact also drops the whitespace between items
+    assert isinstance(node, AST)
+    projection = Projection(node, positions, node_types, max_depth, compact)
+    (comma, colon) = (',', ':') if compact else (', ', ': ')
+    chunks = []
+    # text to write, or (node, depth, whole) still to be expanded into text
+    stack = [(node, 0, False)]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            chunks.append(item)
+            if len(chunks) >= WRITE_BATCH:
+                stream.write(''.join(chunks))
+                chunks.clear()
+            continue
+        node, depth, whole = item
+        parts = ['{"_type"' + colon + '"' + node.__class__.__name__ + '"']
+        if not projection.is_cut(depth):
+            whole = projection.is_whole(node, whole)
+            for (key, value) in projection.items(node, whole):
+                parts.append(comma + '"' + key + '"' + colon)
+                encode(value, parts, comma, colon, depth + 1, whole)
+        parts.append('}')
+        parts.reverse()
+        stack.extend(parts)
+    stream.write(''.join(chunks))
+
+
+def encode(value, parts, comma, colon, depth, whole):
+    # appends the value's text to parts, nodes are appended as they are and expanded later
+    if isinstance(value, AST):
+        parts.append((value, depth, whole))
+    elif isinstance(value, list):
+        parts.append('[')
+        for i, v in enumerate(value):
+            if i:
+                parts.append(comma)
+            encode(v, parts, comma, colon, depth, whole)
+        parts.append(']')
+    elif isinstance(value, dict):
+        parts.append('{')
+        for i, (k, v) in enumerate(value.items()):
+            if i:
+                parts.append(comma)
+            parts.append(encode_basestring_ascii(str(k)) + colon)
+            encode(v, parts, comma, colon, depth, whole)
+        parts.append('}')
+    else:
+        parts.append(encode_scalar(get_value(value)))
+
+
+def encode_scalar(value):
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if isinstance(value, int):
+        return int.__repr__(value)
+    return json.dumps(value)
 
 
-def str2json(string):
-    return ast2json(parse(string))
+def str2json(string, **projection):
+    return ast2json(parse(string), **projection)
 
 
 def get_value(attr_value):
@@ -84,5 +255,4 @@ def get_value(attr_value):
 
 
 if __name__ == '__main__':
-    import json
     print(json.dumps(ast2json(parse(open(__file__, "r").read())), indent=4))
\ No newline at end of file
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import walk_from_func as wf
+from instrumentation import instrumentation
+from module_cache import ModuleCache, DEFAULT_MAX_BYTES
+from module_summary import SUMMARY_VERSION, lazy_functions
+from project_index import index_records, scan_projects
+
+# Generates the graphs of the flows of one or more projects without the editor:
+#   python batch_graphs.py ROOT [ROOT ...] --out DIR [--flow NAME ...] [--jobs N] [--cache-dir DIR]
+# Every graph is written to DIR/<flow name>.json, as walk_from_func outputs it, and DIR/manifest.json
+# lists the flows with their output file, size and time, or the error they failed with.
+# All flows are analysed by this process, so modules are parsed and resolved once for all of them.
+
+def output_name(name, used):
+    # a file name for the flow's graph, unique in the output directory
+    base = re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('._') or "flow"
+    filename = base + ".json"
+    n = 1
+    while filename in used:
+        n += 1
+        filename = f"{base}_{n}.json"
+    used.add(filename)
+    return filename
+
+def select_flows(flows, names):
+    # the discovered flows with the given names, all of them without names
+    if not names:
+        return flows
+    selected = [flow for flow in flows if flow["name"] in names]
+    missing = set(names) - {flow["name"] for flow in selected}
+    if missing:
+        raise ValueError(f"Flows not found: {', '.join(sorted(missing))}")
+    return selected
+
+def write_json_file(data, filepath):
+    tmp = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, filepath)
+
+def generate(roots, out_dir, names=None, project=True, limits=None, index_path=None, executor=None):
+    # writes the graphs of the flows and the manifest, returns the manifest
+    with instrumentation.phase("index"):
+        index = scan_projects(roots, index_path, executor)
+    routes = wf.parse_routes(index_records(index, "routes"))
+    flows = select_flows(index_records(index, "flows"), names)
+    os.makedirs(out_dir, exist_ok=True)
+    analyse = wf.analyse_project_flow if project else wf.analyse_flow
+    manifest = {"roots": [os.path.abspath(root) for root in roots], "project": project, "limits": limits,
+                "routes": len(routes.routes), "flows": []}
+    used = set()
+    for flow in flows:
+        entry = {"name": flow["name"], "file": flow["file"], "func": flow["func"], "root": flow["project_path"]}
+        start = time.perf_counter()
+        try:
+            # analysed from the root the flow was found in, its flows share the root's resolver and project graph
+            output = analyse(flow["file"], flow["func"], routes, limits=limits, root=flow["project_path"])
+        except Exception as e:
+            entry["error"] = str(e)
+        else:
+            entry["output"] = output_name(flow["name"], used)
+            entry["nodes"] = len(output["graph"]["nodes"])
+            entry["edges"] = len(output["graph"]["edges"])
+            write_json_file(output, os.path.join(out_dir, entry["output"]))
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+        manifest["flows"].append(entry)
+    wf.module_cache.save()
+    if instrumentation.enabled:
+        manifest["stats"] = instrumentation.snapshot()
+    write_json_file(manifest, os.path.join(out_dir, "manifest.json"))
+    return manifest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the call graphs of the flows of python projects")
+    parser.add_argument("roots", nargs='+', help="folders of the projects, their routes are matched across all of them")
+    parser.add_argument("--out", required=True, help="directory to write the graphs and manifest.json to")
+    parser.add_argument("--flow", action="append", default=None, help="name of a flow-start marker to generate, can be repeated, all flows without it")
+    parser.add_argument("--crawl", action="store_true", help="crawl the imports of every flow instead of building the call graph of the whole project once")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes scanning and summarizing modules in parallel, 0 uses all cores")
+    parser.add_argument("--cache-dir", default=None, help="directory to keep parsed module summaries and the project index in between runs")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="maximum size of the cache directory in MB")
+    parser.add_argument("--max-depth", type=int, default=None, help="only walk the functions less than this many calls away from the start function")
+    parser.add_argument("--max-nodes", type=int, default=None, help="only walk functions while the graph has at most this many function nodes")
+    parser.add_argument("--stats", action="store_true", default=bool(os.environ.get("FLOW_DOC_STATS")), help="add per phase times and counters to the manifest")
+    args = parser.parse_args()
+    instrumentation.enabled = args.stats
+    instrumentation.reset()
+    wf.jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    index_path = None
+    if args.cache_dir is not None:
+        wf.module_cache = ModuleCache(args.cache_dir, args.cache_size * 1024 * 1024, SUMMARY_VERSION, lazy_functions)
+        index_path = os.path.join(args.cache_dir, "project-index.json")
+    try:
+        limits = wf.request_limits({"max_depth": args.max_depth, "max_nodes": args.max_nodes})
+        manifest = generate(args.roots, args.out, args.flow, not args.crawl, limits, index_path, wf.get_executor())
+    finally:
+        wf.shutdown_executor()
+    failed = [flow for flow in manifest["flows"] if "error" in flow]
+    for flow in failed:
+        print(f"{flow['name']}: {flow['error']}", file=sys.stderr)
+    print(f"{len(manifest['flows']) - len(failed)} of {len(manifest['flows'])} flows written to {args.out}")
+    sys.exit(1 if failed else 0)
@@ -1,131 +1,224 @@
-import ast
-from collections import defaultdict
-
-def is_same_node(f1, f2):
-    return f1["module"] == f2["module"] and f1["func_name"] == f2["func_name"] and f1["file"] == f2["file"]
-
-class GraphMaker(ast.NodeVisitor):
-    def __init__(self, nodes, start_id, max_id):
-        self.nodes = nodes
-        self.current_node = start_id
-        # set of edges
-        self.graph = defaultdict(list) # {(start_id, end_id): [call_lineno]}
-        self.max_id = max_id
-        self.visited_nodes = set([start_id])
-        
-        # set of dotted edges to be added in the graph, so that the logical order of calling services is kept
-        self.dotted_edges = []
-        self.last_route_node = None
-
-    def _get_attribute_chain(self, node):
-        if isinstance(node, ast.Name):
-            return node.id
-        elif isinstance(node, ast.Attribute):
-            return f"{self._get_attribute_chain(node.value)}.{node.attr}"
-        return None
-
-    def _node_exists(new_dict, list_of_dicts):
-        for existing_dict in list_of_dicts:
-            if len(new_dict) == len(existing_dict) and all(new_dict[key] == existing_dict[key] for key in new_dict):
-                return True
-        return False
-
-    def visit_Call(self, node):
-        if hasattr(node, 'is_route') and node.is_route:
-            # TODO: actually import the route nodes and parse them instead of dummy nodes
-            # if (self.last_route_node is not None):
-            #     self.dotted_edges.append((self.last_route_node, node.id))
-            if hasattr(node, 'route') and node.route:
-                for n in self.nodes:
-                    if is_same_node(node.route, n):
-                        self.graph[(self.current_node, n['id'])].append(node.lineno)
-                        
-                        if (self.last_route_node is not None):
-                            self.dotted_edges.append((self.last_route_node["id"], n["id"]))
-                        self.last_route_node = n
-                        
-                        break 
+import hashlib
+import json
+from collections import Counter, defaultdict, deque
+
+# records of the streamed output, one JSON object per line:
+#   {"type": "node", "node": {"module", "file", "func_name", "id", "key", ["is_route"], ["expandable"]}}
+#   {"type": "edge", "start_node": "func_name", "end_node": "func_name", "call_lines": [lineno], "key"}
+#   {"type": "dotted_edge", "start_node": "func_name", "end_node": "func_name", "key"}
+# an edge is sent once all the calls of its start node were walked, so its call_lines are final.
+# "id" is the node's position in the walk, "key" is derived from the content and stays the same
+# between runs: module, file and function name for nodes, and for edges the keys of both ends and
+# how many edges of the same kind with the same ends came before it, e.g. calls to two unknown routes
+def content_key(*parts):
+    return hashlib.blake2b('\0'.join(map(str, parts)).encode(), digest_size=8).hexdigest()
+
+def node_key(n):
+    return content_key(n["module"], n["file"], n["func_name"])
+
+def edge_key(kind, start, end, occurrences):
+    # occurrences: Counter of the edges with a key so far
+    ends = (kind, start["key"], end["key"])
+    key = content_key(*ends, occurrences[ends])
+    occurrences[ends] += 1
+    return key
+
+def node_record(n):
+    return {"type": "node", "node": n}
+
+def output_edge(start, end, call_lines, occurrences):
+    return {"start_node": start["func_name"], "end_node": end["func_name"], "call_lines": call_lines, "key": edge_key("edge", start, end, occurrences)}
+
+def output_dotted_edge(start, end, occurrences):
+    return {"start_node": start["func_name"], "end_node": end["func_name"], "key": edge_key("dotted_edge", start, end, occurrences)}
+
+def edge_record(start, end, call_lines, occurrences):
+    return {"type": "edge", **output_edge(start, end, call_lines, occurrences)}
+
+def dotted_edge_record(start, end, occurrences):
+    return {"type": "dotted_edge", **output_dotted_edge(start, end, occurrences)}
+
+def plan_walk(start, callees, max_depth=None, max_nodes=None):
+    # Which nodes a limited walk expands. Breadth first from start, a node less than max_depth
+    # calls away is expanded if the nodes it adds to the graph still fit into max_nodes.
+    # callees(key) returns the keys of the functions the node calls, None for its route calls.
+    # Returns the expanded keys, and the collapsed ones: reached, but their calls are left out.
+    depth = {start: 0}
+    expanded = set()
+    collapsed = set()
+    queue = deque([start])
+    while queue:
+        key = queue.popleft()
+        called = callees(key)
+        if not called:
+            continue
+        new = [k for k in dict.fromkeys(called) if k is not None and k not in depth]
+        if (max_depth is not None and depth[key] >= max_depth) or (max_nodes is not None and len(depth) + len(new) > max_nodes):
+            collapsed.add(key)
+            continue
+        expanded.add(key)
+        for k in new:
+            depth[k] = depth[key] + 1
+            queue.append(k)
+    return expanded, collapsed
+
+def graph_from_edges(start, outgoing, sink=None, max_depth=None, max_nodes=None):
+    # The graph of a flow, walked depth first from start in call order, for calls that were already
+    # resolved to nodes by the project graph or the flow crawl (project_graph.py).
+    # outgoing(node) returns the node's edges in call order:
+    #   [("call", node, lineno) | ("route", route | None, "requests.method", lineno)]
+    # Nodes are dicts with "module", "file" and "func_name", each reached node is expanded once.
+    # Returns {"nodes": {"func_name": node}, "edges": [...], "dotted_edges": [...]}, or the record counts
+    # if the graph is streamed to sink. max_depth and max_nodes limit the walk, the functions at its
+    # boundary are marked expandable
+    def key_of(n):
+        return (n["module"], n["file"], n["func_name"])
+
+    # with limits only the planned nodes are expanded, their edges are read once
+    expanded = None
+    collapsed = set()
+    planned = dict() # {("module", "file", "func_name"): [edges]}
+    if max_depth is not None or max_nodes is not None:
+        by_key = {key_of(start): start}
+        def callees(key):
+            planned[key] = outgoing(by_key[key])
+            called = []
+            for edge in planned[key]:
+                if edge[0] == "route":
+                    called.append(None)
+                    continue
+                by_key.setdefault(key_of(edge[1]), edge[1])
+                called.append(key_of(edge[1]))
+            return called
+        expanded, collapsed = plan_walk(key_of(start), callees, max_depth, max_nodes)
+
+    def edges_of(n):
+        edges = planned.pop(key_of(n), None)
+        return edges if edges is not None else outgoing(n)
+
+    nodes = []
+    ids = dict() # {("module", "file", "func_name"): id}, of function and route nodes
+    graph = defaultdict(list) # {(start_id, end_id): [call_lineno]}
+    dotted_edges = []
+    last_route_node = None
+    # with a sink, the records of the output are passed to it during the walk instead of being kept
+    counts = {"nodes": 0, "edges": 0, "dotted_edges": 0}
+    ends = defaultdict(dict) # {start_id: {end_id: None}} in call order, only kept with a sink
+    occurrences = Counter() # of the edges, see edge_key
+
+    def send(record, kind):
+        sink(record)
+        counts[kind] += 1
+
+    def add_node(n, is_route=False):
+        new_node = {'module': n["module"], 'file': n["file"], 'func_name': n["func_name"], 'id': len(nodes), 'key': node_key(n)}
+        if is_route:
+            new_node['is_route'] = True
+        elif key_of(n) in collapsed:
+            # collapsed by the limits of the walk, its calls can be walked by an expand request
+            new_node['expandable'] = True
+        nodes.append(new_node)
+        if sink is not None:
+            send(node_record(new_node), "nodes")
+        return new_node
+
+    def add_edge(start_id, end_id, lineno):
+        graph[(start_id, end_id)].append(lineno)
+        if sink is not None:
+            ends[start_id][end_id] = None
+
+    ids[key_of(start)] = add_node(start)['id']
+    walked = set() # keys of the nodes whose calls were walked
+    # explicit stack instead of recursion, deep call chains can't overflow it
+    stack = []
+    if expanded is None or key_of(start) in expanded:
+        walked.add(key_of(start))
+        stack.append((0, iter(edges_of(start))))
+    while stack:
+        current_node, edges = stack[-1]
+        for edge in edges:
+            if edge[0] == "route":
+                (_, route, name, lineno) = edge
+                if route:
+                    key = key_of(route)
+                    if key not in ids:
+                        ids[key] = add_node(route, True)['id']
+                    route_node = nodes[ids[key]]
                 else:
-                    # unvisited external node, create dummy with some info at least
-                    new_node = {'module': node.route["module"], 'file': node.route["file"], 'func_name': node.route["func_name"] , 'ast': None, 'id': self.max_id, 'is_route': True}
-                    self.nodes.append(new_node)
-                    self.graph[(self.current_node, self.max_id)].append(node.lineno)
-                    self.max_id += 1
-
-                    if (self.last_route_node is not None):
-                        self.dotted_edges.append((self.last_route_node["id"], new_node["id"]))
-                    self.last_route_node = new_node
-            else:
-                # the route is unknown / external
-                new_node = {'module': 'dummy', 'file': 'dummy', 'func_name': self._get_attribute_chain(node.func) , 'ast': None, 'id': self.max_id, 'is_route': True}
-                self.nodes.append(new_node)
-                self.graph[(self.current_node, self.max_id)].append(node.lineno)
-                self.max_id += 1
-
-                if (self.last_route_node is not None):
-                    self.dotted_edges.append((self.last_route_node["id"], new_node["id"]))
-                self.last_route_node = new_node
-            return
-        if isinstance(node.func, ast.Name):
-            # Handle simple function calls like "foo()"
-            for n in self.nodes:
-                if node.func.id == n["func_name"]:
-                    self.graph[(self.current_node, n['id'])].append(node.lineno)
-                    # avoid recursion, but still append it to the graph
-                    if n['id'] not in self.visited_nodes:
-                        self.visited_nodes.add(n['id'])
-                        old_node = self.current_node
-                        self.current_node = n['id']
-                        self.visit(n["ast"])
-                        self.current_node = old_node
-                    break
-            else:
-                # The graph should not contain any unrecognized function calls
-                # raise
-                pass
-        elif isinstance(node.func, ast.Attribute):
-            # Handle method calls like "obj.method()"
-            y = self._get_attribute_chain(node.func)
-            for n in self.nodes:
-                if y.startswith(n['module']):
-                    func_name = y[len(n['module'])+1:]
-                    if n['func_name'].endswith(func_name):
-                        self.graph[(self.current_node, n['id'])].append(node.lineno)
-                        old_node = self.current_node
-                        self.current_node = n['id']
-                        self.visit(n["ast"])
-                        self.current_node = old_node
-                    break
-            # else:
-                # raise
-        # self.generic_visit(node)
-
-def create_graph(module, target_func, asts):
-    id = 0
-    start_node = None
-    for x in asts:
-        if x["module"] == module and x["func_name"] == target_func:
-            start_node = x
-        x["id"] = id
-        id += 1
-
-    if start_node == None:
-        raise "No start node given"
-
-    gm = GraphMaker(asts, start_node["id"], id)
-    gm.visit(start_node["ast"])
-    # print(gm.graph)
-    # asts2 = dict()
-    # for node in asts:
-    #     asts2[node["id"]] = node
-    # graph = ["graph TD"]
-    # for (start_id, end_id) in gm.graph:
-    #     graph.append(f"{asts2[start_id]['func_name']} --> {asts2[end_id]['func_name']}")
-    nodes = dict()
-    for ast in asts:
-        nodes[ast["func_name"]] = {k: v for (k, v) in ast.items() if k != 'ast'}
+                    # the route is unknown / external
+                    route_node = add_node({'module': 'dummy', 'file': 'dummy', 'func_name': name}, True)
+                add_edge(current_node, route_node['id'], lineno)
+                if last_route_node is not None:
+                    if sink is not None:
+                        send(dotted_edge_record(last_route_node, route_node, occurrences), "dotted_edges")
+                    else:
+                        dotted_edges.append((last_route_node['id'], route_node['id']))
+                last_route_node = route_node
+                continue
+            (_, n, lineno) = edge
+            key = key_of(n)
+            if key not in ids:
+                ids[key] = add_node(n)['id']
+            add_edge(current_node, ids[key], lineno)
+            # the calls of a function are walked once, also when it was first reached as a route
+            if key not in walked and (expanded is None or key in expanded):
+                walked.add(key)
+                stack.append((ids[key], iter(edges_of(n))))
+                break
+        else:
+            stack.pop()
+            if sink is not None:
+                # all calls of the node were walked, its edges are complete
+                for end_id in ends.pop(current_node, ()):
+                    send(edge_record(nodes[current_node], nodes[end_id], graph.pop((current_node, end_id)), occurrences), "edges")
+
+    if sink is not None:
+        return counts
     return {
-        'nodes': nodes,
-        'edges': [{'start_node': asts[k[0]]["func_name"], 'end_node': asts[k[1]]["func_name"], 'call_lines': v} for (k, v) in gm.graph.items()],
-        'dotted_edges': [{'start_node': asts[k[0]]["func_name"], 'end_node': asts[k[1]]["func_name"]} for k in gm.dotted_edges]
+        'nodes': {n["func_name"]: n for n in nodes},
+        'edges': [output_edge(nodes[k[0]], nodes[k[1]], v, occurrences) for (k, v) in graph.items()],
+        'dotted_edges': [output_dotted_edge(nodes[k[0]], nodes[k[1]], occurrences) for k in dotted_edges]
     }
+
+def graph_elements(graph):
+    # {"nodes": {key: node}, "edges": {key: edge}, "dotted_edges": {key: dotted edge}} of a graph,
+    # the keys are derived from the content for graphs written before they had keys
+    nodes = {name: n if "key" in n else {**n, "key": node_key(n)} for (name, n) in graph["nodes"].items()}
+    elements = {"nodes": {n["key"]: n for n in nodes.values()}}
+    occurrences = Counter()
+    for kind in ("edges", "dotted_edges"):
+        elements[kind] = {e["key"] if "key" in e else edge_key(kind[:-1], nodes[e["start_node"]], nodes[e["end_node"]], occurrences): e
+                          for e in graph[kind]}
+    return elements
+
+def element_hash(element):
+    # everything but the position of the node in the walk
+    return content_key(json.dumps({k: v for (k, v) in element.items() if k != "id"}, sort_keys=True))
+
+def fingerprint_of(elements):
+    return {"type": "fingerprint", **{kind: {key: element_hash(e) for (key, e) in elements[kind].items()} for kind in ("nodes", "edges", "dotted_edges")}}
+
+def graph_fingerprint(graph):
+    # a hash per node and edge, enough to compute the delta of a later graph against this one
+    return fingerprint_of(graph_elements(graph))
+
+def graph_delta(previous, graph):
+    # what changed from previous, a graph or its fingerprint, to graph:
+    #   {"type": "delta", "added": {"nodes": {"func_name": node}, "edges": [...], "dotted_edges": [...]},
+    #    "changed": {"nodes": {"func_name": node}, "edges": [...]},
+    #    "removed": {"nodes": [key], "edges": [key], "dotted_edges": [key]}}
+    # changed nodes and edges have the same key but other content, e.g. other call_lines
+    old = previous if previous.get("type") == "fingerprint" else graph_fingerprint(previous)
+    elements = graph_elements(graph)
+    new = fingerprint_of(elements)
+    delta = {"type": "delta", "added": dict(), "changed": dict(), "removed": dict()}
+    for kind in ("nodes", "edges", "dotted_edges"):
+        added = [e for (key, e) in elements[kind].items() if key not in old[kind]]
+        changed = [e for (key, e) in elements[kind].items() if key in old[kind] and old[kind][key] != new[kind][key]]
+        if kind == "nodes":
+            (added, changed) = ({n["func_name"]: n for n in added}, {n["func_name"]: n for n in changed})
+        delta["added"][kind] = added
+        delta["removed"][kind] = [key for key in old[kind] if key not in new[kind]]
+        if kind != "dotted_edges":
+            delta["changed"][kind] = changed
+    return delta
@@ -5,10 +5,12 @@ import * as vscode from "vscode";
 import * as fs from "fs";
 import * as path from "path";
 import * as child_process from "child_process";
+import * as crypto from "crypto";
 import { FlowsViewProvider } from "./flowsView";
 import { MaintainersViewProvider } from "./maintainersview";
-import { pathsAreEqual, escapeBackSlashRegExp, findNearest } from "./utils";
+import { pathsAreEqual, escapeBackSlashRegExp, findNearest, isProjectFile } from "./utils";
 import { GraphView } from "./graphview";
+import { AnalysisServer } from "./analysisServer";
 import simpleGit, { DefaultLogFields } from 'simple-git';
 // import * as zlib from 'zlib';
 
@@ -17,6 +19,11 @@ export interface LooseObject {
 }
 
 let graphView: GraphView | undefined = undefined;
+let analysisServer: AnalysisServer | undefined = undefined;
+// changed python files collected by the file watcher, sent in one update request once they settle
+let pendingUpdates = new Set<string>();
+let updateTimer: NodeJS.Timeout | undefined = undefined;
+const UPDATE_DELAY_MS = 500;
 
 // This method is called when your extension is activated
 // Your extension is activated the very first time the command is executed
@@ -183,6 +190,13 @@ export function activate(context: vscode.ExtensionContext) {
   context.subscriptions.push(disposable2);
   context.subscriptions.push(disposable3);
   context.subscriptions.push(disposable4);
+
+  // keep the generated graphs up to date with the python files they were built from
+  const pythonWatcher = vscode.workspace.createFileSystemWatcher("**/*.py");
+  pythonWatcher.onDidChange((uri) => scheduleUpdate(context, uri.fsPath));
+  pythonWatcher.onDidCreate((uri) => scheduleUpdate(context, uri.fsPath));
+  pythonWatcher.onDidDelete((uri) => scheduleUpdate(context, uri.fsPath));
+  context.subscriptions.push(pythonWatcher);
 }
 
 function findMaintainers(activeFilePath: string, codeMaintainerMap: LooseObject): LooseObject {
@@ -320,7 +334,15 @@ async function findGitMaintainers(activeFilePath: string): Promise<LooseObject |
 }
 
 // This method is called when your extension is deactivated
-export function deactivate() { }
+export function deactivate() {
+  if (updateTimer !== undefined) {
+    clearTimeout(updateTimer);
+    updateTimer = undefined;
+  }
+  pendingUpdates.clear();
+  analysisServer?.dispose();
+  analysisServer = undefined;
+}
 
 function extractPatterns(filePath: string): Record<string, LooseObject[]> {
   const content = fs.readFileSync(filePath, "utf8");
@@ -457,6 +479,8 @@ export function extractRFF(context: vscode.ExtensionContext) {
   let routes: LooseObject[] = [];
   let flows: LooseObject[] = [];
   let funcs: LooseObject[] = [];
+  // [folderPath, normalized folderPath] of every project
+  let projects: string[][] = [];
 
   monoRepos.forEach((monoRepo) => {
     // IMPORTANT: assumes monolithic architecture of the repository (folder),
@@ -483,35 +507,50 @@ export function extractRFF(context: vscode.ExtensionContext) {
       if (wordCounts[folderPathNorm]) {
         return;
       }
-      const subfolderCounts = extractPatternInSubfolders(folderPath, 0);
-
-      // Add project info to each function and funcs
-      let [projectRoutes, projectFlows, projectFuncs] = flattenRFF(subfolderCounts);
-
-      if (!(projectRoutes.length || projectFlows.length || projectFuncs.length)) {
-        // empty project
-        return;
-      }
-      let projectColor = colors[colorIndex++];
-
-      for (let i = 0; i < projectRoutes.length; ++i) {
-        projectRoutes[i].project_path = folderPathNorm;
-        projectRoutes[i].project_color = projectColor;
-      }
-      for (let i = 0; i < projectFuncs.length; ++i) {
-        projectFuncs[i].project_path = folderPathNorm;
-        projectFuncs[i].project_color = projectColor;
-      }
-
-      routes.push(...projectRoutes);
-      flows.push(...projectFlows);
-      funcs.push(...projectFuncs);
+      projects.push([folderPath, folderPathNorm]);
     });
 
     // if(Object.keys(wordCounts).length === 1) {
     //   return wordCounts[Object.keys(wordCounts)[0]];
     // }
   });
+
+  // all projects are scanned by one python process, the regexes are only used without python
+  const folders = projects.map((project) => project[0]);
+  const index = scanProjects(context, folders);
+  // per workspace, other windows have their own projects and index
+  context.workspaceState.update("projectIndex", index !== undefined ? projectIndexPath(context, folders) : undefined);
+  context.workspaceState.update("projectFolders", folders);
+
+  projects.forEach(([folderPath, folderPathNorm]) => {
+    // Add project info to each function and funcs
+    let [projectRoutes, projectFlows, projectFuncs] = index !== undefined
+      ? indexedRFF(index, folderPath)
+      : flattenRFF(extractPatternInSubfolders(folderPath, 0));
+
+    if (!(projectRoutes.length || projectFlows.length || projectFuncs.length)) {
+      // empty project
+      return;
+    }
+    let projectColor = colors[colorIndex++];
+
+    for (let i = 0; i < projectRoutes.length; ++i) {
+      projectRoutes[i].project_path = folderPathNorm;
+      projectRoutes[i].project_color = projectColor;
+    }
+    for (let i = 0; i < projectFuncs.length; ++i) {
+      projectFuncs[i].project_path = folderPathNorm;
+      projectFuncs[i].project_color = projectColor;
+    }
+    // the flows are analysed from their project folder, all flows of a project share its call graph
+    for (let i = 0; i < projectFlows.length; ++i) {
+      projectFlows[i].root = folderPath;
+    }
+
+    routes.push(...projectRoutes);
+    flows.push(...projectFlows);
+    funcs.push(...projectFuncs);
+  });
   context.globalState.update("routes", routes);
   context.globalState.update("flows", flows);
   context.globalState.update("funcs", funcs);
@@ -528,6 +567,60 @@ export function extractRFF(context: vscode.ExtensionContext) {
   return [routes, flows, funcs];
 }
 
+// the index of the workspace's projects, windows of other workspaces keep their own index
+function projectIndexPath(context: vscode.ExtensionContext, folders: string[]): string {
+  if (context.storageUri !== undefined) {
+    return vscode.Uri.joinPath(context.storageUri, "project-index.json").fsPath;
+  }
+  // no workspace storage without a workspace, the index is named after the scanned folders
+  const hash = crypto.createHash("sha1").update(folders.join("\n")).digest("hex").slice(0, 16);
+  return vscode.Uri.joinPath(context.globalStorageUri, `project-index-${hash}.json`).fsPath;
+}
+
+// scans the projects with project_index.py, which only scans the files changed since the last scan again.
+// undefined if python couldn't scan them
+function scanProjects(context: vscode.ExtensionContext, folders: string[]): LooseObject | undefined {
+  if (!folders.length) {
+    return undefined;
+  }
+  const workspacePath: string = vscode.workspace.workspaceFolders
+    ? vscode.workspace.workspaceFolders[0].uri.fsPath
+    : "";
+  const pythonPath = findNearestVirtualEnv(workspacePath);
+  const scriptPath = vscode.Uri.joinPath(context.extensionUri, "src", "project_index.py");
+  const indexPath = projectIndexPath(context, folders);
+  const result = child_process.spawnSync(pythonPath, [scriptPath.fsPath, indexPath, ...folders, "--jobs", "0"], { encoding: "utf8" });
+  if (result.error !== undefined || result.status !== 0) {
+    console.error(`Project scan failed: ${result.error ?? result.stderr}`);
+    return undefined;
+  }
+  try {
+    return JSON.parse(fs.readFileSync(indexPath, "utf8"));
+  } catch (error) {
+    console.error(`Invalid project index: ${error}`);
+    return undefined;
+  }
+}
+
+// the routes, flows and funcs of one project of the index, the same records flattenRFF returns
+function indexedRFF(index: LooseObject, folderPath: string): [LooseObject[], LooseObject[], LooseObject[]] {
+  let routes: LooseObject[] = [];
+  let flows: LooseObject[] = [];
+  let funcs: LooseObject[] = [];
+  for (const file of Object.keys(index.files)) {
+    const entry = index.files[file];
+    if (!pathsAreEqual(entry.project, folderPath)) {
+      continue;
+    }
+    const withFile = (record: LooseObject) => ({ ...record, file: file });
+    routes.push(...entry.routes.map(withFile));
+    // flow-end markers are listed with the flows
+    flows.push(...entry.flows.map(withFile), ...entry.flow_ends.map(withFile));
+    funcs.push(...entry.funcs.map(withFile));
+  }
+  return [routes, flows, funcs];
+}
+
 function extractPatternInSubfolders(folderPath: string, level: number): LooseObject {
   const files = fs.readdirSync(folderPath, { withFileTypes: true });
   const subfolderCounts: LooseObject = {};
@@ -647,50 +740,142 @@ function isPythonInstalled(): boolean {
   return result.error === undefined && result.status === 0;
 }
 
-function runPythonProg(extensionUri: vscode.Uri, flow: LooseObject, endPoints: LooseObject[]): Promise<Record<string, string[]>> {
-  return new Promise((resolve, reject) => {
+function getAnalysisServer(context: vscode.ExtensionContext): AnalysisServer | undefined {
+  if (analysisServer !== undefined) {
+    return analysisServer;
+  }
 
-    if (isPythonInstalled() === false) {
-      reject(`Python is not installed.`);
-      return;
-    }
+  if (isPythonInstalled() === false) {
+    return undefined;
+  }
 
-    var workspacePath: string = vscode.workspace.workspaceFolders
-      ? vscode.workspace.workspaceFolders[0].uri.fsPath
-      : "";
+  var workspacePath: string = vscode.workspace.workspaceFolders
+    ? vscode.workspace.workspaceFolders[0].uri.fsPath
+    : "";
 
-    const pythonPath = findNearestVirtualEnv(workspacePath);
+  const pythonPath = findNearestVirtualEnv(workspacePath);
 
-    const pythonScriptPath = vscode.Uri.joinPath(extensionUri, "src", "walk_from_func.py");
-    const endP = JSON.stringify(endPoints);
+  const pythonScriptPath = vscode.Uri.joinPath(context.extensionUri, "src", "walk_from_func.py");
+  // parsed modules are cached between sessions
+  const cachePath = vscode.Uri.joinPath(context.globalStorageUri, "python-cache");
 
-    // // Consider if argument size gets too large
-    // console.log(endP.length);
-    // const comp = zlib.gzipSync(endP).toString('base64');
-    // console.log(comp.length);
-    var output: string[] = [];
-    var errors: string[] = [];
+  // project modules are summarized by one worker process per core
+  analysisServer = new AnalysisServer(pythonPath, pythonScriptPath.fsPath, ["--cache-dir", cachePath.fsPath, "--jobs", "0"]);
+  return analysisServer;
+}
 
-    const pythonProcess = child_process.spawn(pythonPath, [pythonScriptPath.fsPath, flow.file, flow.func, endP]);
+function runPythonProg(server: AnalysisServer, flow: LooseObject, project: boolean = false): Promise<LooseObject> {
+  return server.request({ cmd: "graph", file: flow.file, func: flow.func, root: flow.root, project: project });
+}
 
-    pythonProcess.stdout.on("data", (data: any) => {
-      console.log(data.toString());
-      output.push(data);
-    });
+// match graph funcs with extracted funcs
+function annotateGraph(graph: LooseObject, routes: LooseObject[], funcs: LooseObject[]): LooseObject {
+  const data: LooseObject = { graph: graph };
+  for (let id in data.graph.nodes) {
+    let node = data.graph.nodes[id];
+
+    // Node is a http call
+    let unknownNode = false;
+
+    if (node.is_route) {
+      const route = routes.filter((endPoint) => pathsAreEqual(endPoint.file, node.file) && endPoint.func_name === node.func_name);
+      if (route.length) {
+        node.lineno = route[0].lineno;
+        node.project_path = route[0].project_path;
+        node.project_color = route[0].project_color;
+      }
+      else {
+        unknownNode = true;
+      }
+    }
+    // Node is a function call
+    else {
+      const func = funcs.filter((func) => pathsAreEqual(func.file, node.file) && func.name === node.func_name);
+      // TODO: remove if condition, dummy check
+      if (func.length) {
+        node.lineno = func[0].lineno;
+        node.project_path = func[0].project_path;
+        node.project_color = func[0].project_color;
+      }
+      else {
+        unknownNode = true;
+      }
+    }
+    if (unknownNode) {
+      node.lineno = 0;
+      node.project_path = "dummy";
+      node.project_color = "#ff0000";
+    }
+  }
+  return data;
+}
 
-    pythonProcess.stderr.on("error", (data: any) => {
-      console.error(`Python Script Error: ${data}`);
-      errors.push(data);
-    });
+// applies the delta of a graph update to the graph it was computed against,
+// nodes and edges are matched by their "key"
+function applyGraphDelta(graph: LooseObject, delta: LooseObject, routes: LooseObject[], funcs: LooseObject[]): LooseObject {
+  const removedNodes = new Set(delta.removed.nodes);
+  for (const name of Object.keys(graph.nodes)) {
+    if (removedNodes.has(graph.nodes[name].key)) {
+      delete graph.nodes[name];
+    }
+  }
+  const nodes = annotateGraph({ nodes: { ...delta.added.nodes, ...delta.changed.nodes } }, routes, funcs).graph.nodes;
+  Object.assign(graph.nodes, nodes);
+
+  const removedEdges = new Set([...delta.removed.edges, ...delta.changed.edges.map((edge: LooseObject) => edge.key)]);
+  graph.edges = graph.edges.filter((edge: LooseObject) => !removedEdges.has(edge.key)).concat(delta.added.edges, delta.changed.edges);
+  const removedDottedEdges = new Set(delta.removed.dotted_edges);
+  graph.dotted_edges = graph.dotted_edges.filter((edge: LooseObject) => !removedDottedEdges.has(edge.key)).concat(delta.added.dotted_edges);
+  return graph;
+}
 
-    pythonProcess.on("close", (code: any) => {
-      if (code === 0) {
-        resolve({ outputs: output, errors: errors });
-      } else {
-        reject(`Python script exited with code ${code}`);
+// collects the changed file for the next update, bursts of events like a branch switch or
+// a pip install into a venv become one request. Files outside the projects can't change any graph
+function scheduleUpdate(context: vscode.ExtensionContext, file: string) {
+  const projectFolders: string[] = context.workspaceState.get("projectFolders") || [];
+  if (!projectFolders.some((folder) => isProjectFile(file, folder))) {
+    return;
+  }
+  pendingUpdates.add(file);
+  if (updateTimer !== undefined) {
+    clearTimeout(updateTimer);
+  }
+  updateTimer = setTimeout(() => {
+    updateTimer = undefined;
+    const files = [...pendingUpdates];
+    pendingUpdates.clear();
+    updateGraphs(context, files);
+  }, UPDATE_DELAY_MS);
+}
+
+// re-analyses the flows depending on the changed files, only the changed graphs come back
+function updateGraphs(context: vscode.ExtensionContext, files: string[]) {
+  // nothing was analysed yet
+  if (analysisServer === undefined) {
+    return;
+  }
+  // only what changed in the graphs comes back
+  analysisServer.request({ cmd: "update", files: files, delta: true }).then((response) => {
+    const allFlows: LooseObject[] = context.globalState.get("flows") || [];
+    const routes: LooseObject[] = context.globalState.get("routes") || [];
+    const funcs: LooseObject[] = context.globalState.get("funcs") || [];
+    const graphs: LooseObject = context.globalState.get("graphs") || {};
+
+    for (const result of response.results) {
+      if (result.error !== undefined) {
+        console.error(`Graph update failed: ${result.error}`);
+        continue;
       }
+      const flow = allFlows.find((el) => pathsAreEqual(el.file, result.file) && el.func === result.func);
+      if (flow !== undefined && graphs[flow.name] !== undefined) {
+        graphs[flow.name].graph = applyGraphDelta(graphs[flow.name].graph, result.delta, routes, funcs);
+      }
+    }
+    context.globalState.update("graphs", graphs);
+  })
+    .catch((error) => {
+      console.error('Error:', error);
     });
-  });
 }
 
 export function createGraph(context: vscode.ExtensionContext, flowName: string | undefined = undefined, refresh: boolean = false) {
@@ -725,6 +910,22 @@ export function createGraph(context: vscode.ExtensionContext, flowName: string |
   }
 
 
+  const server = getAnalysisServer(context);
+  if (server === undefined) {
+    vscode.window.showErrorMessage(`Graph generation failed: Python is not installed.`);
+    return;
+  }
+  // routes are sent once to the analysis server instead of once per flow,
+  // or only the path of the project index they are read from
+  const projectIndex: string | undefined = context.workspaceState.get("projectIndex");
+  if (projectIndex !== undefined) {
+    server.setIndex(projectIndex, refresh);
+  } else {
+    server.setRoutes(routes, refresh);
+  }
+  // when generating all graphs, the call graph of the project is built once and shared by the flows
+  const wholeProject = flowName === undefined;
+
   for (let i = 0; i < flows.length; ++i) {
 
     if (graphView === undefined) {
@@ -740,53 +941,8 @@ export function createGraph(context: vscode.ExtensionContext, flowName: string |
       continue;
     }
 
-    runPythonProg(context.extensionUri, flows[i], routes).then((result) => {
-      if (result.errors.length) {
-        result.errors.forEach(err => console.error(err));
-        vscode.window.showErrorMessage(`Graph generation for flow '${flowName}' failed`);
-        throw new Error();
-      }
-      if (result.outputs.length !== 1) {
-        throw new Error("too much python output");
-      }
-      const data = JSON.parse(result.outputs[0]);
-      // match graph funcs with extracted funcs
-      for (let id in data.graph.nodes) {
-        let node = data.graph.nodes[id];
-
-        // Node is a http call
-        let unknownNode = false;
-
-        if (node.is_route) {
-          const route = routes.filter((endPoint) => pathsAreEqual(endPoint.file, node.file) && endPoint.func_name === node.func_name);
-          if (route.length) {
-            node.lineno = route[0].lineno;
-            node.project_path = route[0].project_path;
-            node.project_color = route[0].project_color;
-          }
-          else {
-            unknownNode = true;
-          }
-        }
-        // Node is a function call
-        else {
-          const func = funcs.filter((func) => pathsAreEqual(func.file, node.file) && func.name === node.func_name);
-          // TODO: remove if condition, dummy check
-          if (func.length) {
-            node.lineno = func[0].lineno;
-            node.project_path = func[0].project_path;
-            node.project_color = func[0].project_color;
-          }
-          else {
-            unknownNode = true;
-          }
-        }
-        if (unknownNode) {
-          node.lineno = 0;
-          node.project_path = "dummy";
-          node.project_color = "#ff0000";
-        }
-      }
+    runPythonProg(server, flows[i], wholeProject).then((result) => {
+      const data = annotateGraph(result.graph, routes, funcs);
 
       if (refresh || !graphs[flowName]) {
         graphs[flowName] = data;
@@ -0,0 +1,123 @@
+from array import array
+
+# module id of a removed function, its id is reused by the next added function
+REMOVED = 0xFFFFFFFF
+# marks route edges in FunctionTable.edge_targets, the rest of the value indexes FunctionTable.routes
+ROUTE = 1 << 31
+
+class Names:
+    # interns strings as small integer ids, e.g. module, file and function names
+    __slots__ = ("ids", "names")
+
+    def __init__(self):
+        self.ids = dict() # {"name": id}
+        self.names = [] # ["name"] by id
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+class FunctionTable:
+    # The functions of a project and the calls between them, in arrays indexed by function id
+    # instead of a dict per function and a tuple per edge. Module, file and function names are
+    # interned. The edges of all functions are kept in flat arrays, function i's edges are
+    # edge_targets[edge_offsets[i]:edge_offsets[i + 1]] and its call lines are at the same positions.
+    __slots__ = ("names", "module", "file", "func_name", "by_key", "free",
+                 "edge_offsets", "edge_targets", "edge_lines", "use_offsets", "use_modules", "routes", "route_ids")
+
+    def __init__(self):
+        self.names = Names()
+        self.module = array('I') # [module name id] by function id
+        self.file = array('I') # [file name id]
+        self.func_name = array('I') # [function name id]
+        self.by_key = dict() # {module name id << 32 | function name id: function id}
+        self.free = [] # ids of removed functions
+        self.clear_edges()
+
+    def clear_edges(self):
+        self.edge_offsets = array('I', [0])
+        self.edge_targets = array('I') # [function id | ROUTE | route index]
+        self.edge_lines = array('I') # [call lineno]
+        # the modules the calls of function i were resolved through, use_modules[use_offsets[i]:use_offsets[i + 1]]
+        self.use_offsets = array('I', [0])
+        self.use_modules = array('I') # [module name id]
+        self.routes = [] # [(route | None, "requests.method")] of the route edges
+        self.route_ids = dict() # {(id(route) | None, "requests.method"): index in routes}
+
+    def add(self, module, file, func_name):
+        ids = (self.names.id(module), self.names.id(file), self.names.id(func_name))
+        if self.free:
+            fid = self.free.pop()
+            (self.module[fid], self.file[fid], self.func_name[fid]) = ids
+        else:
+            fid = len(self.module)
+            self.module.append(ids[0])
+            self.file.append(ids[1])
+            self.func_name.append(ids[2])
+        self.by_key[ids[0] << 32 | ids[2]] = fid
+        return fid
+
+    def remove(self, fid):
+        del self.by_key[self.module[fid] << 32 | self.func_name[fid]]
+        self.module[fid] = REMOVED
+        self.free.append(fid)
+
+    def find(self, module, func_name):
+        # looking up doesn't intern the names
+        (module_id, name_id) = (self.names.ids.get(module), self.names.ids.get(func_name))
+        if module_id is None or name_id is None:
+            return None
+        return self.by_key.get(module_id << 32 | name_id)
+
+    def node(self, fid):
+        return {"module": self.names[self.module[fid]], "file": self.names[self.file[fid]], "func_name": self.names[self.func_name[fid]]}
+
+    def key(self, fid):
+        return (self.names[self.module[fid]], self.names[self.func_name[fid]])
+
+    def link(self, link):
+        # relinks all functions in id order, link(fid) returns the function's edges and the
+        # modules they were resolved through:
+        #   ([("call", fid, lineno) | ("route", route | None, "requests.method", lineno)], {"module"})
+        self.clear_edges()
+        for fid in range(len(self.module)):
+            if self.module[fid] != REMOVED:
+                edges, used_modules = link(fid)
+                for edge in edges:
+                    if edge[0] == "call":
+                        self.edge_targets.append(edge[1])
+                    else:
+                        self.edge_targets.append(ROUTE | self._route_id(edge[1], edge[2]))
+                    self.edge_lines.append(edge[-1])
+                self.use_modules.extend(self.names.id(m) for m in sorted(used_modules))
+            self.edge_offsets.append(len(self.edge_targets))
+            self.use_offsets.append(len(self.use_modules))
+
+    def _route_id(self, route, name):
+        key = (id(route) if route is not None else None, name)
+        index = self.route_ids.get(key)
+        if index is None:
+            index = self.route_ids[key] = len(self.routes)
+            self.routes.append((route, name))
+        return index
+
+    def edges(self, fid):
+        # the function's edges like link got them, with nodes instead of function ids
+        edges = []
+        for i in range(self.edge_offsets[fid], self.edge_offsets[fid + 1]):
+            target = self.edge_targets[i]
+            if target & ROUTE:
+                (route, name) = self.routes[target & ~ROUTE]
+                edges.append(("route", route, name, self.edge_lines[i]))
+            else:
+                edges.append(("call", self.node(target), self.edge_lines[i]))
+        return edges
+
+    def uses(self, fid):
+        return [self.names[m] for m in self.use_modules[self.use_offsets[fid]:self.use_offsets[fid + 1]]]
@@ -0,0 +1,54 @@
+import contextlib
+import time
+from collections import defaultdict
+
+# shared by all phases while instrumentation is disabled, so they cost next to nothing
+NULL_PHASE = contextlib.nullcontext()
+
+class Phase:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        # [name, wall start, cpu start, wall of nested phases, cpu of nested phases]
+        self.instrumentation.stack.append([self.name, time.perf_counter(), time.process_time(), 0.0, 0.0])
+
+    def __exit__(self, *exc):
+        name, wall_start, cpu_start, nested_wall, nested_cpu = self.instrumentation.stack.pop()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        # phases only count their own time, not the time of the phases nested in them
+        totals = self.instrumentation.phases[name]
+        totals[0] += wall - nested_wall
+        totals[1] += cpu - nested_cpu
+        if self.instrumentation.stack:
+            self.instrumentation.stack[-1][3] += wall
+            self.instrumentation.stack[-1][4] += cpu
+
+class Instrumentation:
+    # Opt-in wall/cpu time per phase of the analysis and counters of the work done in them.
+    # Phases can be nested, e.g. "find_spec" inside "crawl".
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.phases = defaultdict(lambda: [0.0, 0.0]) # {"phase": [wall_s, cpu_s]}
+        self.counters = defaultdict(int) # {"counter": count}
+        self.stack = []
+
+    def phase(self, name):
+        return Phase(self, name) if self.enabled else NULL_PHASE
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def snapshot(self):
+        return {
+            "phases": {name: {"wall_s": wall, "cpu_s": cpu} for (name, (wall, cpu)) in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+instrumentation = Instrumentation()
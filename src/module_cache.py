@@ -0,0 +1,219 @@
+import hashlib
+import marshal
+import os
+import time
+from instrumentation import instrumentation
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+class ModuleCache:
+    # Summaries of parsed modules, kept in memory and optionally in a cache directory.
+    # Entries are valid while the file's mtime and size are unchanged, or, if they did change,
+    # while the content hash is the same. The directory is bounded by max_bytes, least recently
+    # used entries are evicted first.
+    # unresolved counts the parts of a summary which are completed in place after it was cached,
+    # e.g. functions parsed on first use, summaries which got completed are written again on save.
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, version=0, unresolved=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version
+        self.unresolved = unresolved
+        self.memory = dict() # {"path": (mtime_ns, size, summary, digest)}
+        self.index = dict() # {"key": [path, mtime_ns, size, digest, nbytes, last_used]}
+        self.incomplete = dict() # {"path": ("key", unresolved parts when it was written)}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.index = self._read_index()
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index")
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".summary")
+
+    def _read_index(self):
+        try:
+            with open(self._index_path(), 'rb') as f:
+                version, index = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return dict()
+        # summaries of another version can't be reused
+        return index if version == self.version else dict()
+
+    def _read_entry(self, key, digest):
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                entry_digest, summary = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return summary if entry_digest == digest else None
+
+    def _write(self, path, data):
+        # write and rename, so concurrent readers never see half written files
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def get(self, filepath, summarize):
+        return self.get_many([filepath], summarize)[filepath]
+
+    def get_many(self, filepaths, summarize, executor=None):
+        # summaries of all the files, the ones which have to be built are summarized by the executor,
+        # e.g. a ProcessPoolExecutor, if one is given
+        summaries = dict()
+        pending = [] # [(filepath, st, key, entry, digest, source)]
+        for filepath in filepaths:
+            if filepath in summaries:
+                continue
+            st = os.stat(filepath)
+            cached = self.memory.get(filepath)
+            if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                self.hits += 1
+                instrumentation.count("cache_hits")
+                summaries[filepath] = cached[2]
+                continue
+
+            summary = None
+            digest = None
+            key = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+            entry = self.index.get(key) if self.cache_dir is not None else None
+            self.incomplete.pop(filepath, None)
+            if entry is not None and entry[1] == st.st_mtime_ns and entry[2] == st.st_size:
+                # unchanged on disk, don't even read the source
+                digest = entry[3]
+                with instrumentation.phase("read"):
+                    summary = self._read_entry(key, digest)
+            if summary is None:
+                with instrumentation.phase("read"):
+                    with open(filepath, 'rb') as f:
+                        source = f.read()
+                instrumentation.count("bytes_read", len(source))
+                digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+                if entry is not None and entry[3] == digest:
+                    # touched, but the content is the same
+                    with instrumentation.phase("read"):
+                        summary = self._read_entry(key, digest)
+                if summary is None:
+                    summaries[filepath] = None
+                    pending.append((filepath, st, key, entry, digest, source))
+                    continue
+                entry[1] = st.st_mtime_ns
+                entry[2] = st.st_size
+            self.hits += 1
+            instrumentation.count("cache_hits")
+            self._store(filepath, st, entry, summary, digest)
+            self._track(filepath, key, summary)
+            summaries[filepath] = summary
+
+        sources = [p[5] for p in pending]
+        instrumentation.count("modules_parsed", len(sources))
+        if executor is not None and len(pending) > 1:
+            # summaries come back in order, a failing file raises like in the serial loop
+            results = executor.map(summarize, sources, chunksize=max(1, len(sources) // 64))
+        else:
+            results = map(summarize, sources)
+        for (filepath, st, key, entry, digest, source), summary in zip(pending, self._timed(results)):
+            self.misses += 1
+            if self.cache_dir is not None:
+                with instrumentation.phase("cache_write"):
+                    nbytes = self._write(self._entry_path(key), marshal.dumps((digest, summary)))
+                entry = [filepath, st.st_mtime_ns, st.st_size, digest, nbytes, 0]
+                self.index[key] = entry
+            self._store(filepath, st, entry, summary, digest)
+            self._track(filepath, key, summary)
+            summaries[filepath] = summary
+        return summaries
+
+    def _timed(self, results):
+        # the summaries are built while they are taken from the iterator
+        results = iter(results)
+        while True:
+            with instrumentation.phase("summarize"):
+                summary = next(results, None)
+            if summary is None:
+                return
+            yield summary
+
+    def _store(self, filepath, st, entry, summary, digest):
+        if entry is not None:
+            entry[5] = time.time()
+            self.dirty = True
+        self.memory[filepath] = (st.st_mtime_ns, st.st_size, summary, digest)
+
+    def _track(self, filepath, key, summary):
+        # remembers the cached summaries which can still be completed
+        if self.cache_dir is None or self.unresolved is None:
+            return
+        unresolved = self.unresolved(summary)
+        if unresolved:
+            self.incomplete[filepath] = (key, unresolved)
+
+    def _write_completed(self):
+        # writes the summaries which were completed since they were written
+        for filepath, (key, unresolved) in list(self.incomplete.items()):
+            cached = self.memory.get(filepath)
+            entry = self.index.get(key)
+            if cached is None or entry is None or entry[3] != cached[3]:
+                del self.incomplete[filepath]
+                continue
+            left = self.unresolved(cached[2])
+            if left == unresolved:
+                continue
+            with instrumentation.phase("cache_write"):
+                entry[4] = self._write(self._entry_path(key), marshal.dumps((entry[3], cached[2])))
+            entry[5] = time.time()
+            self.dirty = True
+            if left:
+                self.incomplete[filepath] = (key, left)
+            else:
+                del self.incomplete[filepath]
+
+    def digest(self, filepath):
+        # content hash of the file's cached summary, None if it isn't cached
+        cached = self.memory.get(filepath)
+        return cached[3] if cached is not None else None
+
+    def invalidate(self, files=None):
+        if files is None:
+            self.memory.clear()
+            self.incomplete.clear()
+            return
+        for filepath in files:
+            self.memory.pop(filepath, None)
+            self.incomplete.pop(filepath, None)
+
+    def save(self):
+        if self.cache_dir is None:
+            return
+        self._write_completed()
+        if not self.dirty:
+            return
+        # merge with entries written by other processes in the meantime
+        index = self._read_index()
+        for key, entry in self.index.items():
+            if key not in index or index[key][5] <= entry[5]:
+                index[key] = entry
+
+        # evict least recently used entries
+        total = sum(entry[4] for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda x: x[1][5]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+            total -= entry[4]
+            del index[key]
+
+        self._write(self._index_path(), marshal.dumps((self.version, index)))
+        self.index = index
+        self.dirty = False
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
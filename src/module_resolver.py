@@ -0,0 +1,108 @@
+import importlib.machinery
+import os
+import sys
+from instrumentation import instrumentation
+
+# same lookup order as importlib's FileFinder
+MODULE_SUFFIXES = importlib.machinery.EXTENSION_SUFFIXES + importlib.machinery.SOURCE_SUFFIXES + importlib.machinery.BYTECODE_SUFFIXES
+
+class ModuleResolver:
+    # Resolves module names to files the way importlib.util.find_spec does, but only by looking
+    # at the file system: nothing is ever imported, so no project code runs during the analysis.
+    # Directory listings and resolved names are memoized, so the cost depends on the number of
+    # files and not on the number of import statements.
+    def __init__(self, search_path, listings=None):
+        self.search_path = list(search_path)
+        self.listings = dict() if listings is None else listings # {"dir": {"entry", ...}}, can be shared between resolvers
+        self.specs = dict() # {"name": ("origin" | None, ["submodule", "search", "dirs"] | None) | None}
+
+    def _listing(self, directory):
+        # an empty sys.path entry stands for the working directory
+        directory = directory or os.getcwd()
+        if directory not in self.listings:
+            try:
+                self.listings[directory] = set(os.listdir(directory))
+            except OSError:
+                self.listings[directory] = set()
+        return self.listings[directory]
+
+    def _find_in(self, directories, name):
+        namespace_dirs = []
+        for directory in directories:
+            entries = self._listing(directory)
+            if name in entries:
+                package_dir = os.path.join(directory, name)
+                package_entries = self._listing(package_dir)
+                for suffix in MODULE_SUFFIXES:
+                    if "__init__" + suffix in package_entries:
+                        return (os.path.join(package_dir, "__init__" + suffix), [package_dir])
+            for suffix in MODULE_SUFFIXES:
+                if name + suffix in entries:
+                    return (os.path.join(directory, name + suffix), None)
+            if name in entries and os.path.isdir(os.path.join(directory, name)):
+                namespace_dirs.append(os.path.join(directory, name))
+        if namespace_dirs:
+            # namespace package, has no file of its own
+            return (None, namespace_dirs)
+        return None
+
+    def find_spec(self, name):
+        if name in self.specs:
+            return self.specs[name]
+        instrumentation.count("modules_resolved")
+        with instrumentation.phase("find_spec"):
+            spec = self._find_spec(name)
+        self.specs[name] = spec
+        return spec
+
+    def _find_spec(self, name):
+        if name in sys.builtin_module_names:
+            spec = ('built-in', None)
+        elif importlib.machinery.FrozenImporter.find_spec(name) is not None:
+            spec = ('frozen', None)
+        else:
+            parent, _, child = name.rpartition('.')
+            if parent:
+                parent_spec = self.find_spec(parent)
+                if parent_spec is None or parent_spec[1] is None:
+                    spec = None
+                else:
+                    spec = self._find_in(parent_spec[1], child)
+            else:
+                spec = self._find_in(self.search_path, name)
+        return spec
+
+    def origin(self, name):
+        spec = self.find_spec(name)
+        return spec[0] if spec is not None else None
+
+    def is_package(self, name):
+        spec = self.find_spec(name)
+        return spec is not None and spec[1] is not None
+
+    def resolve_import(self, current_module, module, level):
+        # absolute name of "from <level dots><module> import ..." inside current_module
+        if not level:
+            return module
+        package = current_module if self.is_package(current_module) else current_module.rpartition('.')[0]
+        parts = package.split('.') if package else []
+        if level - 1 > len(parts):
+            # beyond the top-level package, fall back to the name itself
+            return module
+        base = '.'.join(parts[:len(parts) - (level - 1)])
+        if module is None:
+            return base or None
+        return f"{base}.{module}" if base else module
+
+    def invalidate(self, files=None):
+        if files is None:
+            self.listings.clear()
+        else:
+            for filepath in files:
+                self.listings.pop(os.path.dirname(filepath), None)
+                # created/deleted folders show up in the listing of their parent
+                path = os.path.abspath(filepath)
+                while os.path.dirname(path) != path:
+                    path = os.path.dirname(path)
+                    self.listings.pop(path, None)
+        self.specs.clear()
@@ -0,0 +1,311 @@
+import ast
+import re
+from instrumentation import instrumentation
+
+REQUEST_METHODS = ["get", "post", "delete", "put", "head"]
+
+# bump whenever the shape of the summaries changes, so cached summaries get rebuilt
+SUMMARY_VERSION = 5
+
+# A module summary is the list of events symbol tables are built from, in visiting order:
+#   ("Import", [("name", "asname" | None), ...])
+#   ("ImportFrom", "module" | None, [("name", "asname" | None), ...], level)
+#   ("FunctionDef", "name", [function events])
+# and a function summary is the list of events a function's calls are resolved from:
+#   ("Import", [("name", "asname" | None), ...])
+#   ("ImportFrom", "module" | None, [("name", "asname" | None), ...], level)
+#   ("FunctionDef", "name")  # nested function
+#   ("Call", "Name" | "Attribute", "func" | "attr.chain", lineno, top, request)
+# where top is False for calls nested in another call and request is
+# ("METHOD", "endpoint regex", "cv pattern") for requests.get/post/... calls, otherwise None.
+# The function events of functions start out as [LAZY, lineno, b"source", {aliases}],
+# function_events summarizes them on first use.
+# Only plain tuples, lists, dicts, strings, bytes and ints are used, so summaries can be marshalled.
+
+# marks function events which weren't summarized yet
+LAZY = "lazy"
+
+# Finds the lines starting a statement without parsing the module. Strings, comments and
+# brackets are skipped as a whole, so the lines inside them are never matched.
+SCAN = re.compile(rb'''
+    ^(?P<line>[ \t]*)(?=[^\s\#])
+  | (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<comment>\#[^\n]*)
+  | (?P<continuation>\\\r?\n)
+  | (?P<open>[(\[{])
+  | (?P<close>[)\]}])
+  | (?P<quote>["'])
+''', re.MULTILINE | re.DOTALL | re.VERBOSE)
+# statements which continue the compound statement before them
+CONTINUES = re.compile(rb"(?:else|elif|except|finally)\b")
+DEF = re.compile(rb"def[ \t]+([A-Za-z_][A-Za-z0-9_]*)[ \t]*\(")
+CLASS = re.compile(rb"class[ \t]")
+# functions importing requests change the module's request aliases, they are summarized right away
+REQUESTS_IMPORT = re.compile(rb"^[ \t]*(?:import|from)[ \t][^\n]*\brequests\b", re.MULTILINE)
+# in the first two lines, a module in another encoding than utf-8 can't be sliced as bytes
+CODING = re.compile(rb"^[ \t\f]*#.*?coding[:=]", re.MULTILINE)
+
+class ArgsVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.res_string = []
+        self.res_pattern = ""
+        self.first_string = False
+
+    def visit_Name(self, node):
+        if self.first_string:
+            self.res_string.append('([^/]+)')
+            self.res_pattern += 'v'
+
+    def visit_Constant(self, node):
+        self.first_string = True
+
+        constant = node.value
+        # normalize slashes
+        constant = constant.replace('\\', '/')
+        # remove initial slashes
+        while len(constant) and constant[0] == '/':
+            constant = constant[1:]
+        # remove final slashes
+        while len(constant) and constant[-1] == '/':
+            constant = constant[:-1]
+        self.res_string.append(constant)
+
+        self.res_pattern += 'c' * len(constant.split('/'))
+
+def get_attribute_chain(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        return f"{get_attribute_chain(node.value)}.{node.attr}"
+    return None
+
+def imported_names(node):
+    return [(x.name, x.asname) for x in node.names]
+
+def request_aliases(tree):
+    # names under which the module can call requests.get/post/...
+    # {"requests": "requests", "rq": "requests", "get": "requests.get"}
+    aliases = {"requests": "requests"}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == "requests":
+                    aliases[alias.asname or alias.name] = "requests"
+        elif isinstance(node, ast.ImportFrom) and node.module == "requests" and not node.level:
+            for alias in node.names:
+                if alias.name in REQUEST_METHODS:
+                    aliases[alias.asname or alias.name] = "requests." + alias.name
+    return aliases
+
+class FunctionSummarizer(ast.NodeVisitor):
+    def __init__(self, root, aliases, line_offset=0):
+        self.root = root
+        self.aliases = aliases
+        self.events = []
+        self.call_depth = 0
+        # line of the parsed source's first line in the module, minus 1
+        self.line_offset = line_offset
+
+    def visit_Import(self, node):
+        self.events.append(("Import", imported_names(node)))
+
+    def visit_ImportFrom(self, node):
+        if node.module is not None or node.level:
+            self.events.append(("ImportFrom", node.module, imported_names(node), node.level))
+
+    def visit_FunctionDef(self, node):
+        if node is not self.root:
+            self.events.append(("FunctionDef", node.name))
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        top = self.call_depth == 0
+        if isinstance(node.func, ast.Name):
+            self.events.append(("Call", "Name", node.func.id, node.lineno + self.line_offset, top, self._request(node, node.func.id)))
+        elif isinstance(node.func, ast.Attribute):
+            chain = get_attribute_chain(node.func)
+            self.events.append(("Call", "Attribute", chain, node.lineno + self.line_offset, top, self._request(node, chain)))
+        self.call_depth += 1
+        self.generic_visit(node)
+        self.call_depth -= 1
+
+    def _request(self, node, chain):
+        # handle requests.get/post/delete/put/head(...), also when imported under another name
+        head, _, rest = chain.partition('.')
+        if head not in self.aliases:
+            return None
+        resolved = self.aliases[head] + ('.' + rest if rest else '')
+        module, _, method = resolved.rpartition('.')
+        if module != "requests" or method not in REQUEST_METHODS:
+            return None
+        av = ArgsVisitor()
+        if len(node.args):
+            # url is always first argument
+            av.visit(node.args[0])
+        else:
+           for named_arg in node.keywords:
+               if named_arg.arg == 'url':
+                   av.visit(named_arg.value)
+                   break
+        endpoint = '/' + '/'.join(av.res_string) + '/'
+        return (method.upper(), endpoint, av.res_pattern)
+
+class ModuleSummarizer(ast.NodeVisitor):
+    def __init__(self, aliases, line_offset=0):
+        self.aliases = aliases
+        self.events = []
+        self.line_offset = line_offset
+
+    def visit_Import(self, node):
+        self.events.append(("Import", imported_names(node)))
+
+    def visit_ImportFrom(self, node):
+        if node.module is not None or node.level:
+            self.events.append(("ImportFrom", node.module, imported_names(node), node.level))
+
+    def visit_FunctionDef(self, node):
+        fs = FunctionSummarizer(node, self.aliases, self.line_offset)
+        fs.visit(node)
+        self.events.append(("FunctionDef", node.name, fs.events))
+
+def scan_module(source):
+    # (offset, lineno, indentation) of the lines starting a statement,
+    # None if the scanner can't split the module reliably
+    starts = []
+    depth = 0
+    continued = False
+    lineno = 1
+    last = 0
+    for m in SCAN.finditer(source):
+        kind = m.lastgroup
+        if kind == "line":
+            if depth == 0 and not continued:
+                if b"\t" in m.group("line"):
+                    # tabs can't be compared with spaces
+                    return None
+                lineno += source.count(b"\n", last, m.start())
+                last = m.start()
+                starts.append((m.start(), lineno, m.end() - m.start()))
+        elif kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif kind == "quote":
+            # a string the scanner doesn't understand, e.g. an unterminated one
+            return None
+        continued = kind == "continuation"
+    if depth != 0:
+        return None
+    return starts
+
+def split_block(source, starts, lo, hi, end):
+    # [(b"source", lineno, "function name" | None)] for the statements in starts[lo:hi], which end
+    # at offset end. Functions are kept apart, with their decorators, and the bodies of classes are
+    # split the same way, the other statements are grouped
+    chunks = []
+    indent = starts[lo][2]
+    group = None # (offset, lineno) of the statements which aren't functions yet
+    head = None # (offset, lineno) of the decorators of the next statement
+    i = lo
+    while i < hi:
+        (start, lineno, _) = starts[i]
+        # the statement's lines go up to the next one with the same indentation
+        j = i + 1
+        while j < hi and starts[j][2] > indent:
+            j += 1
+        statement_end = starts[j][0] if j < hi else end
+        code = start + indent
+        if head is None and CONTINUES.match(source, code):
+            # else/except/... belong to the statement before them, which isn't a function
+            i = j
+            continue
+        if source[code:code + 1] == b"@":
+            head = head or (start, lineno)
+            i = j
+            continue
+        (first, first_lineno) = head or (start, lineno)
+        head = None
+        function = DEF.match(source, code)
+        # a class only gives the events of its body, its body lines follow the class line
+        is_class = CLASS.match(source, code) is not None and j > i + 1 and starts[i + 1][2] > indent
+        if (function is None and not is_class) or REQUESTS_IMPORT.search(source, first, statement_end):
+            group = group or (first, first_lineno)
+            i = j
+            continue
+        if group is not None:
+            chunks.append((source[group[0]:first], group[1], None))
+            group = None
+        if function is not None:
+            chunks.append((source[first:statement_end], first_lineno, function.group(1).decode()))
+        else:
+            chunks += split_block(source, starts, i + 1, j, statement_end)
+        i = j
+    if group is not None:
+        chunks.append((source[group[0]:end], group[1], None))
+    return chunks
+
+def parse_chunk(source, lineno):
+    # the statements of a chunk in the node's body, and the offset of the chunk's line numbers.
+    # Indented chunks are parsed as the body of an "if"
+    if source[:1] == b" ":
+        return ast.parse(b"if 1:\n" + source).body[0], lineno - 2
+    return ast.parse(source), lineno - 1
+
+def summarize_module(source):
+    # functions are only parsed when their events are used, see function_events.
+    # Modules the scanner can't split are parsed as a whole
+    starts = None
+    if isinstance(source, bytes) and not CODING.search(b"\n".join(source.split(b"\n", 2)[:2])):
+        starts = scan_module(source)
+    if not starts:
+        return summarize_tree(ast.parse(source))
+    chunks = split_block(source, starts, 0, len(starts), len(source))
+    # the other statements are parsed right away, they give the request aliases of the functions
+    parsed = [parse_chunk(chunk, lineno) if name is None else None for (chunk, lineno, name) in chunks]
+    aliases = {"requests": "requests"}
+    for tree in parsed:
+        if tree is not None:
+            aliases.update(request_aliases(tree[0]))
+    events = []
+    for (chunk, lineno, name), tree in zip(chunks, parsed):
+        if tree is None:
+            events.append(("FunctionDef", name, [LAZY, lineno, chunk, aliases]))
+            continue
+        ms = ModuleSummarizer(aliases, tree[1])
+        for node in tree[0].body:
+            ms.visit(node)
+        events += ms.events
+    return events
+
+def summarize_module_eagerly(source):
+    # with the events of all functions, for modules whose functions are all linked, like the
+    # modules of a project graph. Parsed along with the module, e.g. by the worker processes
+    summary = summarize_module(source)
+    for event in summary:
+        if event[0] == "FunctionDef":
+            function_events(event[2])
+    return summary
+
+def lazy_functions(summary):
+    # the number of functions of a module summary which weren't summarized yet
+    return sum(1 for event in summary if event[0] == "FunctionDef" and event[2] and event[2][0] == LAZY)
+
+def summarize_tree(tree):
+    ms = ModuleSummarizer(request_aliases(tree))
+    ms.visit(tree)
+    return ms.events
+
+def function_events(events):
+    # the events of a function, a function is parsed and summarized on first use
+    if events and events[0] == LAZY:
+        (_, lineno, source, aliases) = events
+        instrumentation.count("functions_parsed")
+        (tree, line_offset) = parse_chunk(source, lineno)
+        node = tree.body[0]
+        fs = FunctionSummarizer(node, aliases, line_offset)
+        fs.visit(node)
+        # in place, the summary in the cache keeps the parsed events
+        events[:] = fs.events
+    return events
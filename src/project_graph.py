@@ -0,0 +1,291 @@
+import os
+import sys
+from collections import deque
+from create_graph import graph_from_edges
+from function_table import FunctionTable
+from module_summary import function_events
+from instrumentation import instrumentation
+
+# folders which never contain project code
+SKIPPED_FOLDERS = {"__pycache__", "node_modules", "site-packages"}
+
+def find_project_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        # hidden folders and virtual environments are not part of the project
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d not in SKIPPED_FOLDERS
+                       and not os.path.exists(os.path.join(dirpath, d, "pyvenv.cfg"))]
+        for filename in filenames:
+            if filename.endswith(".py") and not filename.startswith('.'):
+                yield os.path.join(dirpath, filename)
+
+def is_project_file(root, filepath):
+    # same rules as find_project_files, for a single file
+    parts = os.path.relpath(filepath, root).split(os.sep)
+    if parts[0] == os.pardir or not parts[-1].endswith(".py") or parts[-1].startswith('.'):
+        return False
+    for i, part in enumerate(parts[:-1]):
+        if part.startswith('.') or part in SKIPPED_FOLDERS or os.path.exists(os.path.join(root, *parts[:i + 1], "pyvenv.cfg")):
+            return False
+    return True
+
+def module_name(root, filepath):
+    parts = os.path.relpath(filepath, root)[:-len(".py")].split(os.sep)
+    if len(parts) > 1 and parts[-1] == "__init__":
+        parts.pop()
+    return '.'.join(parts)
+
+class ModuleSymbols:
+    # One symbol table per module: the functions it defines and the names its imports bind,
+    # read from the module summaries, and the resolution of calls through them.
+    # function_id(module, func_name) is what calls to a function defined by module resolve to
+    def __init__(self, root, routes, resolver, load_summary, function_id):
+        self.root = root
+        self.routes = routes
+        self.resolver = resolver
+        self.load_summary = load_summary
+        self.function_id = function_id
+        self.modules = dict() # {"module": "file"}
+        self.module_by_file = dict() # {"file": "module"}
+        self.defs = dict() # {"module": {"func_name": [function events]}}
+        self.symbols = dict() # {"module": {"bound name": ("module", "mod") | ("from", "mod", "name")}}
+        self.used_modules = None # collects the modules consulted while linking a function
+        self.route_targets = dict() # {id(route): (route, target)}
+
+    def read_module(self, module, filepath):
+        summary = self.load_summary(filepath)
+        self.modules[module] = filepath
+        self.module_by_file[filepath] = module
+        defs = dict()
+        symbols = dict()
+        for event in summary:
+            if event[0] == "FunctionDef":
+                # first definition wins, like in the flow crawl
+                defs.setdefault(event[1], event[2])
+            else:
+                self.bind(module, symbols, event)
+        self.defs[module] = defs
+        self.symbols[module] = symbols
+        return defs
+
+    def bind(self, module, symbols, event):
+        if event[0] == "Import":
+            for (name, asname) in event[1]:
+                if asname:
+                    symbols[asname] = ("module", name)
+                else:
+                    # "import a.b" binds "a"
+                    head = name.split('.')[0]
+                    symbols[head] = ("module", head)
+        elif event[0] == "ImportFrom":
+            (_, from_module, names, level) = event
+            from_module = self.resolver.resolve_import(module, from_module, level)
+            if from_module is None:
+                return
+            for (name, asname) in names:
+                symbols[asname or name] = ("from", from_module, name)
+
+    def user_module(self, name):
+        # project module the name is imported as, or None for outside/unknown modules
+        module = self.module_by_file.get(self.resolver.origin(name))
+        if module is not None and self.used_modules is not None:
+            self.used_modules.add(module)
+        return module
+
+    def resolve_symbol(self, module, name, symbols=None, depth=0):
+        # follows re-exports like "from .impl import func" in a package's __init__
+        if name in self.defs[module]:
+            return self.function_id(module, name)
+        binding = (symbols if symbols is not None else self.symbols[module]).get(name)
+        if binding is None or binding[0] != "from" or depth > 10:
+            return None
+        target = self.user_module(binding[1])
+        if target is None:
+            return None
+        return self.resolve_symbol(target, binding[2], depth=depth + 1)
+
+    def resolve_chain(self, symbols, chain):
+        parts = chain.split('.')
+        binding = symbols.get(parts[0])
+        if binding is not None and binding[0] == "module":
+            parts = binding[1].split('.') + parts[1:]
+        elif binding is not None:
+            # "from pkg import mod", then "mod.func()"
+            parts = binding[1].split('.') + [binding[2]] + parts[1:]
+        # longest module prefix which defines the rest of the chain
+        for i in range(len(parts) - 1, 0, -1):
+            target = self.user_module('.'.join(parts[:i]))
+            if target is not None:
+                return self.resolve_symbol(target, '.'.join(parts[i:])) if i == len(parts) - 1 else None
+        return None
+
+    def function_symbols(self, module, events):
+        # the module's symbols, with the imports inside the function
+        symbols = self.symbols[module]
+        if any(event[0] in ("Import", "ImportFrom") for event in events):
+            symbols = dict(symbols)
+            for event in events:
+                self.bind(module, symbols, event)
+        return symbols
+
+    def route_target(self, request):
+        # the route a request call goes to, None for unknown/exterior routes. Routes are named by
+        # their file name, the ones in the project get the module name their function's node has
+        route = self.routes.match(*request)
+        if route is None:
+            return None
+        if id(route) not in self.route_targets:
+            filepath = os.path.abspath(route["file"])
+            target = route
+            if is_project_file(self.root, filepath):
+                target = {"module": module_name(self.root, filepath), "file": filepath, "func_name": route["func_name"]}
+            self.route_targets[id(route)] = (route, target)
+        return self.route_targets[id(route)][1]
+
+    def resolve_call(self, module, symbols, kind, func):
+        if kind == "Name":
+            return self.resolve_symbol(module, func, symbols)
+        return self.resolve_chain(symbols, func)
+
+    def link(self, module, func_name):
+        # the function's calls, resolved through the module's symbols, as graph_from_edges walks them:
+        #   [("call", function id, lineno) | ("route", route | None, "requests.method", lineno)]
+        # calls nested in another call, like the g in f(g()), aren't followed
+        events = function_events(self.defs[module][func_name])
+        symbols = self.function_symbols(module, events)
+        instrumentation.count("functions_visited")
+        edges = []
+        for event in events:
+            if event[0] != "Call":
+                continue
+            instrumentation.count("call_sites")
+            (_, kind, func, lineno, top, request) = event
+            if not top:
+                continue
+            if request is not None:
+                edges.append(("route", self.route_target(request), "requests." + request[0].lower(), lineno))
+                continue
+            target = self.resolve_call(module, symbols, kind, func)
+            if target is not None:
+                edges.append(("call", target, lineno))
+        return edges
+
+class ProjectGraph(ModuleSymbols):
+    # Call graph of all the user modules below root, built once: function nodes, call edges with
+    # their line numbers and route edges. Flow graphs are then extracted by walking it from
+    # the flow's start function, instead of crawling the modules again for every flow.
+    def __init__(self, root, routes, resolver, load_summary, load_summaries=None):
+        # the function nodes, their call and route edges and the modules each function's calls were resolved through
+        self.functions = FunctionTable()
+        super().__init__(root, routes, resolver, load_summary, self.functions.find)
+        # loads many summaries at once, e.g. in parallel, before they are read one by one
+        self.load_summaries = load_summaries
+        self.scan()
+
+    def scan(self):
+        files = [f for f in find_project_files(self.root) if not f.startswith(sys.prefix)]
+        if self.load_summaries is not None:
+            self.load_summaries(files)
+        for filepath in files:
+            self.add_module(module_name(self.root, filepath), filepath)
+        self.link_all()
+
+    def link_all(self):
+        def link(fid):
+            self.used_modules = set()
+            return self.link(*self.functions.key(fid)), self.used_modules
+        with instrumentation.phase("link"):
+            self.functions.link(link)
+        self.used_modules = None
+
+    def update(self, files):
+        # re-reads the changed, created or deleted files and relinks the calls,
+        # the summaries of the other modules are reused
+        changed = False
+        files = [os.path.abspath(f) for f in files]
+        files = [f for f in files if is_project_file(self.root, f)]
+        if self.load_summaries is not None:
+            self.load_summaries([f for f in files if os.path.exists(f)])
+        for filepath in files:
+            if filepath in self.module_by_file:
+                self.remove_module(self.module_by_file[filepath])
+            if os.path.exists(filepath):
+                self.add_module(module_name(self.root, filepath), filepath)
+            changed = True
+        if changed:
+            self.link_all()
+        return changed
+
+    def add_module(self, module, filepath):
+        for func_name in self.read_module(module, filepath):
+            self.functions.add(module, filepath, func_name)
+
+    def remove_module(self, module):
+        for func_name in self.defs.pop(module):
+            self.functions.remove(self.functions.find(module, func_name))
+        del self.symbols[module]
+        del self.module_by_file[self.modules.pop(module)]
+
+    def flow_graph(self, module, func_name, sink=None, max_depth=None, max_nodes=None):
+        # returns the flow's graph, or the record counts if it is streamed to sink, and the files it was built from
+        start = self.functions.find(module, func_name)
+        if start is None:
+            raise ValueError(f"Function '{func_name}' not found in module '{module}'")
+        files = set()
+        def outgoing(n):
+            fid = self.functions.find(n["module"], n["func_name"])
+            files.add(n["file"])
+            files.update(self.modules[m] for m in self.functions.uses(fid))
+            return self.functions.edges(fid)
+        with instrumentation.phase("flow_graph"):
+            return graph_from_edges(self.functions.node(start), outgoing, sink, max_depth, max_nodes), files
+
+class FlowCrawl(ModuleSymbols):
+    # The functions a flow reaches from its start function, linked like in the project graph and
+    # walked the same way. Only the modules the flow reaches are read, each one once into its symbol
+    # table, and the functions are linked from a worklist, each one once, so the crawl's cost
+    # grows with the reachable functions rather than with how often modules import each other.
+    def __init__(self, root, routes, resolver, load_summary):
+        # functions are known by (module, func_name) before they are linked
+        super().__init__(root, routes, resolver, load_summary, lambda module, func_name: (module, func_name))
+        self.edges = dict() # {("module", "func_name"): [edges]} of the reached functions, see link
+
+    def user_module(self, name):
+        # project modules are read when the crawl first resolves a name to them
+        origin = self.resolver.origin(name)
+        module = self.module_by_file.get(origin)
+        if module is None and origin is not None and origin != 'built-in' and not origin.startswith(sys.prefix) \
+                and is_project_file(self.root, origin):
+            module = module_name(self.root, origin)
+            if module in self.modules:
+                # imported through another name resolving to the same file
+                return module
+            self.read_module(module, origin)
+        return module
+
+    def crawl(self, module, filepath, func_name):
+        # links the functions reachable from the start function, returns the crawl
+        self.read_module(module, filepath)
+        if func_name not in self.defs[module]:
+            return self
+        worklist = deque([(module, func_name)])
+        while worklist:
+            function = worklist.popleft()
+            if function in self.edges:
+                continue
+            self.edges[function] = self.link(*function)
+            worklist.extend(edge[1] for edge in self.edges[function] if edge[0] == "call" and edge[1] not in self.edges)
+        return self
+
+    def node(self, function):
+        (module, func_name) = function
+        return {"module": module, "file": self.modules[module], "func_name": func_name}
+
+    def flow_graph(self, module, func_name, sink=None, max_depth=None, max_nodes=None):
+        # returns the graph from a reached function, or the record counts if it is streamed to sink
+        if (module, func_name) not in self.edges:
+            raise ValueError(f"Function '{func_name}' not found in module '{module}'")
+        def outgoing(n):
+            return [("call", self.node(edge[1]), edge[2]) if edge[0] == "call" else edge
+                    for edge in self.edges[(n["module"], n["func_name"])]]
+        with instrumentation.phase("flow_graph"):
+            return graph_from_edges(self.node((module, func_name)), outgoing, sink, max_depth, max_nodes)
@@ -0,0 +1,161 @@
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from module_summary import SCAN
+from project_graph import find_project_files
+
+# bump whenever the shape of the index changes, so indexes get rebuilt
+INDEX_VERSION = 1
+
+# The index of a project, written as JSON:
+#   {"version": 1, "files": {"path": {"project": "root", "mtime": ns, "size": n,
+#                                     "routes": [...], "funcs": [...], "flows": [...], "flow_ends": [...]}}}
+# with the same records the extension used to extract with regexes:
+#   routes:    {"module", "name", "methods", "route_pattern", "lineno", "func_name"}
+#   funcs:     {"module", "name", "lineno"}  (lineno counted from 0)
+#   flows:     {"module", "name", "lineno", "func"}  (same for flow_ends)
+# Files whose mtime and size didn't change keep their records when a project is scanned again.
+
+FLOW_START = re.compile(rb"#+\s*flow-start\((.+)\)")
+FLOW_END = re.compile(rb"#+\s*flow-end\((.+)\)")
+
+def route_pattern(name):
+    # 'c' for constant and 'v' for variable parts, e.g. "cv" for /user/<user_id>
+    return ''.join('v' if part[0] == '<' and part[-1] == '>' else 'c' for part in name.split('/') if part)
+
+def route_decorator(decorator):
+    # (name, methods) of an @app.route("name", methods=[...]) decorator, None for other decorators
+    if not (isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute) and decorator.func.attr == "route"
+            and isinstance(decorator.func.value, ast.Name) and decorator.func.value.id == "app"):
+        return None
+    if not decorator.args or not isinstance(decorator.args[0], ast.Constant) or not isinstance(decorator.args[0].value, str):
+        return None
+    methods = ["GET"]
+    for keyword in decorator.keywords:
+        if keyword.arg == "methods" and isinstance(keyword.value, (ast.List, ast.Tuple)):
+            methods = [x.value.strip() for x in keyword.value.elts if isinstance(x, ast.Constant) and isinstance(x.value, str)]
+    return decorator.args[0].value, methods
+
+def flow_markers(source, module, functions):
+    # (flows, flow_ends) of the flow-start/flow-end comments, a marker belongs to the
+    # first function defined on its line or after it
+    flows, flow_ends = [], []
+    lineno = 1
+    last = 0
+    for m in SCAN.finditer(source):
+        if m.lastgroup != "comment":
+            continue
+        for (pattern, markers) in ((FLOW_START, flows), (FLOW_END, flow_ends)):
+            marker = pattern.match(m.group("comment"))
+            if marker is None:
+                continue
+            lineno += source.count(b"\n", last, m.start())
+            last = m.start()
+            func = next((name for (def_lineno, name) in functions if def_lineno >= lineno), None)
+            if func is not None:
+                markers.append({"module": module, "name": marker.group(1).decode(errors="replace"), "lineno": lineno, "func": func})
+    return flows, flow_ends
+
+def scan_file(filepath):
+    # the records of one file, files which don't parse have none
+    module = os.path.splitext(os.path.basename(filepath))[0]
+    records = {"routes": [], "funcs": [], "flows": [], "flow_ends": []}
+    with open(filepath, 'rb') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        records["error"] = str(e)
+        return records
+    functions = [] # [(lineno, "name")] in order of their def lines
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        functions.append((node.lineno, node.name))
+        for decorator in node.decorator_list:
+            route = route_decorator(decorator)
+            if route is not None:
+                (name, methods) = route
+                records["routes"].append({"module": module, "name": name, "methods": methods, "route_pattern": route_pattern(name),
+                                          "lineno": decorator.lineno, "func_name": node.name})
+    functions.sort()
+    records["routes"].sort(key=lambda r: r["lineno"])
+    records["funcs"] = [{"module": module, "name": name, "lineno": lineno - 1} for (lineno, name) in functions]
+    records["flows"], records["flow_ends"] = flow_markers(source, module, functions)
+    return records
+
+def read_index(index_path):
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {"version": INDEX_VERSION, "files": dict()}
+    # an index of another version is scanned again
+    return index if index.get("version") == INDEX_VERSION else {"version": INDEX_VERSION, "files": dict()}
+
+def write_index(index, index_path):
+    # write and rename, so readers never see half written indexes
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp, index_path)
+
+def scan_projects(roots, index_path=None, executor=None):
+    # the index of the projects, the files changed since the index at index_path are scanned again,
+    # in parallel if an executor, e.g. a ProcessPoolExecutor, is given. The index is written back to index_path
+    old = read_index(index_path)["files"] if index_path is not None else dict()
+    files = dict()
+    pending = [] # [("path", "project", stat)]
+    for root in map(os.path.abspath, roots):
+        # the same files the project graph and the extension's file watcher take as the project's
+        for filepath in sorted(find_project_files(root)):
+            st = os.stat(filepath)
+            entry = old.get(filepath)
+            if entry is not None and entry["project"] == root and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                files[filepath] = entry
+                continue
+            files[filepath] = None
+            pending.append((filepath, root, st))
+    paths = [p[0] for p in pending]
+    if executor is not None and len(pending) > 1:
+        results = executor.map(scan_file, paths, chunksize=max(1, len(paths) // 64))
+    else:
+        results = map(scan_file, paths)
+    for (filepath, root, st), records in zip(pending, results):
+        files[filepath] = {"project": root, "mtime": st.st_mtime_ns, "size": st.st_size, **records}
+    index = {"version": INDEX_VERSION, "files": files}
+    if index_path is not None:
+        write_index(index, index_path)
+    return index
+
+def index_records(index, kind):
+    # the records of one kind ("routes", "funcs", "flows" or "flow_ends") of all files,
+    # with the "file" and "project_path" they were found in
+    return [{**record, "file": filepath, "project_path": entry["project"]}
+            for (filepath, entry) in index["files"].items() for record in entry[kind]]
+
+def load_routes(index_path):
+    return index_records(read_index(index_path), "routes")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index the routes, functions and flow markers of python projects")
+    parser.add_argument("index", help="file to write the index to, files unchanged since it was last written aren't scanned again")
+    parser.add_argument("roots", nargs='+', help="folders of the projects")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes scanning files in parallel, 0 uses all cores")
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        index = scan_projects(args.roots, args.index, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    errors = {f: entry["error"] for (f, entry) in index["files"].items() if "error" in entry}
+    for filepath, error in errors.items():
+        print(f"{filepath}: {error}", file=sys.stderr)
+    print(json.dumps({kind: len(index_records(index, kind)) for kind in ("routes", "funcs", "flows", "flow_ends")}))
@@ -0,0 +1,82 @@
+import re
+from instrumentation import instrumentation
+
+VARIABLE_SEGMENT = '([^/]+)'
+# stands in for VARIABLE_SEGMENT while an endpoint is split, the variable part contains a '/' itself
+VARIABLE_PLACEHOLDER = '\0'
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+class RouteTrie:
+    def __init__(self):
+        self.children = dict() # {"segment": RouteTrie}
+        self.routes = [] # [(position, route)] of all routes in this subtree
+
+class RouteIndex:
+    # Routes grouped by HTTP method and 'cv' pattern, with the segments of their names in a trie.
+    # Matches the same route as trying re.match(endpoint, route["name"]) on every route in order.
+    def __init__(self, routes):
+        self.routes = routes
+        self.buckets = dict() # {("METHOD", "cv pattern"): RouteTrie}
+        self.matches = dict() # {("METHOD", "endpoint", "cv pattern"): route | None}
+        for position, route in enumerate(routes):
+            if "name" not in route:
+                continue
+            for method in route.get('methods', []):
+                trie = self.buckets.setdefault((method, route.get('route_pattern', '')), RouteTrie())
+                trie.routes.append((position, route))
+                for segment in self._segments(route['name']):
+                    trie = trie.children.setdefault(segment, RouteTrie())
+                    trie.routes.append((position, route))
+
+    def _segments(self, name):
+        inner = name[1:-1]
+        return inner.split('/') if inner else []
+
+    def _endpoint_segments(self, endpoint):
+        # the segments of an endpoint regex, with VARIABLE_SEGMENT for its variable parts
+        segments = self._segments(endpoint.replace(VARIABLE_SEGMENT, VARIABLE_PLACEHOLDER))
+        return [segment.replace(VARIABLE_PLACEHOLDER, VARIABLE_SEGMENT) for segment in segments]
+
+    def _is_plain(self, segments):
+        for segment in segments:
+            if segment == VARIABLE_SEGMENT:
+                continue
+            # a variable part within a constant segment is left to the regex
+            if not segment or any(c in REGEX_CHARS for c in segment):
+                return False
+        return True
+
+    def match(self, method, endpoint, pattern):
+        key = (method, endpoint, pattern)
+        if key not in self.matches:
+            self.matches[key] = self._match(method, endpoint, pattern)
+        return self.matches[key]
+
+    def _match(self, method, endpoint, pattern):
+        bucket = self.buckets.get((method, pattern))
+        if bucket is None:
+            return None
+        segments = self._endpoint_segments(endpoint)
+        if not segments or not self._is_plain(segments):
+            # regex characters in the url, compare the slow way
+            regex = re.compile(endpoint)
+            for i, (position, route) in enumerate(bucket.routes):
+                if regex.match(route['name']):
+                    instrumentation.count("route_comparisons", i + 1)
+                    return route
+            instrumentation.count("route_comparisons", len(bucket.routes))
+            return None
+
+        # the endpoint matches a prefix of the route names, ending in a '/'
+        nodes = [bucket]
+        for segment in segments:
+            # one comparison per trie node the segment is looked up in
+            instrumentation.count("route_comparisons", len(nodes))
+            if segment == VARIABLE_SEGMENT:
+                # any segment, as long as it isn't empty
+                nodes = [child for node in nodes for (name, child) in node.children.items() if name]
+            else:
+                nodes = [node.children[segment] for node in nodes if segment in node.children]
+            if not nodes:
+                return None
+        return min((node.routes[0] for node in nodes if node.routes), key=lambda x: x[0], default=(None, None))[1]
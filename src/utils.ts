@@ -10,6 +10,20 @@ export function pathsAreEqual(path1: string, path2: string) {
   return path1 === path2;
 }
 
+// folders which never contain project code, same as SKIPPED_FOLDERS in project_graph.py
+const SKIPPED_FOLDERS = new Set(["__pycache__", "node_modules", "site-packages"]);
+
+// whether the file is part of the project in folder: below it, and not in a hidden, cache or package folder
+export function isProjectFile(filePath: string, folder: string) {
+  const resolve = (p: string) => process.platform === "win32" ? path.resolve(p).toLowerCase() : path.resolve(p);
+  const relative = path.relative(resolve(folder), resolve(filePath));
+  if (relative === "" || relative.startsWith("..") || path.isAbsolute(relative)) {
+    return false;
+  }
+  const folders = relative.split(path.sep).slice(0, -1);
+  return !folders.some((name) => name.startsWith(".") || SKIPPED_FOLDERS.has(name));
+}
+
 export function escapeRegExp(string: string) {
   return string.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
 }
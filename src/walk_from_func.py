@@ -1,304 +1,436 @@
-import ast
-import importlib.util
-import re
+import argparse
+import cProfile
+import os
 import sys
-from collections import defaultdict
-from create_graph import create_graph
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from create_graph import graph_delta, graph_fingerprint
+from instrumentation import instrumentation
+from module_cache import ModuleCache, DEFAULT_MAX_BYTES
+from module_resolver import ModuleResolver
+from project_graph import FlowCrawl, ProjectGraph, is_project_file, module_name
+from route_index import RouteIndex
+from module_summary import SUMMARY_VERSION, lazy_functions, summarize_module, summarize_module_eagerly
+from project_index import load_routes
 from ast2json import ast2json
 import json
 
 proj_path = ''
+base_sys_path = list(sys.path)
 
-def get_module_file(name):
-    try:
-        module = importlib.util.find_spec(name)
-        # module.origin can be  = 'built-in', in which case we should ignore for unnecessary imports
-        return module.origin if module.origin != 'built-in' else False
-    except Exception as e:
-        # print(e)
-        return False
+# warm state, kept between requests when running as a server
+resolvers = dict() # {"proj_path": ModuleResolver}
+directory_listings = dict() # shared by all resolvers
+module_cache = ModuleCache(version=SUMMARY_VERSION, unresolved=lazy_functions)
+project_graphs = dict() # {"proj_path": ProjectGraph}
+crawled_flows = dict() # {("file", "func", "root"): (FlowCrawl, {"file": digest})}, walked again by expand requests
+dependencies = set() # files read by the current analysis
+jobs = 1 # worker processes summarizing modules, 1 summarizes them in this process
+executor = None
 
-def is_module_user_defined(name):
-    try:
-        module = importlib.util.find_spec(name)
-        if module.origin is not None and not module.origin.startswith(sys.prefix) and module.origin.lower().startswith(proj_path.lower()):
-            return True
-        return False
-    except Exception as e:
-        # print(e)
-        return False
+def get_resolver():
+    # the flow's own project is searched last, like a path appended to sys.path
+    if proj_path not in resolvers:
+        resolvers[proj_path] = ModuleResolver(base_sys_path + [proj_path], directory_listings)
+    return resolvers[proj_path]
 
-class ImportVisitor(ast.NodeVisitor):
-    def __init__(self, target_module, target_funcs, modules_to_import, already_visited, routes = dict()):
-        self.current_module = target_module # str
-        self.target_funcs = defaultdict(set, target_funcs) # {"mod1": {"func1", "func2"}, "mod2": {func1, func2}}
-        self.already_visited = defaultdict(set, already_visited) # {"mod1": {func1", "func2"}, "mod2": {func1, func2}}
-        self.modules_to_import = defaultdict(lambda: ("", set()), modules_to_import) # {"name": ("path", {"func1", "func2"})}
-        self.imported_modules = set(already_visited.keys()) # {"name", "name2"}
-        self.asts = defaultdict(lambda: defaultdict(set))
-        self.references_per_module = defaultdict(lambda: defaultdict(set))
-        self.routes = routes
+def load_summary(filepath):
+    # summaries are reused while the file is unchanged on disk. The functions of single
+    # modules are only parsed when the flow crawl reaches them
+    dependencies.add(filepath)
+    return module_cache.get(filepath, summarize_module)
 
-    def visit_Import(self, node):
-        for alias in node.names:
-            x = get_module_file(alias.name)
-            if x:
-                self.references_per_module[self.current_module][alias.name] = set()
-                self.modules_to_import[alias.name] = (x, set())
-        return node
+def get_executor():
+    global executor
+    if executor is None and jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    return executor
 
-    def visit_ImportFrom(self, node):
-        if node.module is not None:
-            x = get_module_file(node.module)
-            if x:
-                self.references_per_module[self.current_module][node.module].update(set(map(lambda x: x.asname if x.asname else x.name, node.names)))
-                self.modules_to_import[node.module] = (x, set(map(lambda x: x.asname if x.asname else x.name, node.names)))
-        return node
-    
-    def visit_FunctionDef(self, node):
-        self.references_per_module[self.current_module][self.current_module].add(node.name)
-        if node.name not in self.target_funcs[self.current_module] or node.name in self.already_visited[self.current_module]:
-            if not self.current_module in self.modules_to_import:
-                x = get_module_file(self.current_module)
-                self.modules_to_import[self.current_module] = (x, set())
-            self.modules_to_import[self.current_module][1].add(node.name)
-            return
-        
-        self.asts[self.current_module].update({node.name: node})
+def load_summaries(filepaths):
+    # summarizes the files which aren't cached yet in parallel, with all their functions,
+    # which are all linked into the project graph
+    dependencies.update(filepaths)
+    return module_cache.get_many(filepaths, summarize_module_eagerly, get_executor())
 
-        fw = FunctionVisitor(self.current_module, node.name, self.modules_to_import, self.already_visited, self.routes)
-        fw.visit(node)
-        imps = fw.modules_to_import
-        tfs = fw.function_references
-        self.already_visited[self.current_module].add(node.name)
-        for new_imp, (m_file, new_funcs) in imps.items():
-            if new_imp in self.imported_modules:
-                continue
-            if new_imp not in self.modules_to_import:
-                self.modules_to_import[new_imp] = (m_file, new_funcs)
-            else:
-                self.modules_to_import[new_imp][1].update(new_funcs)
-            self.references_per_module[self.current_module][new_imp].update(new_funcs)
-        for mod_name, funcs in tfs.items():
-            self.references_per_module[self.current_module][mod_name].update(funcs)
-            self.target_funcs[mod_name].update(funcs)
+def shutdown_executor():
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
 
-        for mod_name, funcs in self.target_funcs.items():
-            if mod_name in self.imported_modules:
-                continue
-            (mod_file, _) = self.modules_to_import[mod_name]
-            if not len(funcs):
-                continue
-            if not is_module_user_defined(mod_name):
-                continue
-            with open(mod_file, 'r') as f:
-                text = f.read()
-            tree = ast.parse(text)
-            iv = ImportVisitor(mod_name, {mod_name: funcs}, self.modules_to_import, self.already_visited, self.routes)
-            iv.visit(tree)
-            for k in iv.references_per_module.keys():
-                self.references_per_module[k].update(iv.references_per_module[k])
-                # TODO: references from new module should be somehow added to the current module references
-                # self.references_per_module[self.current_module].update(iv.references_per_module[k])
-            for k, v in iv.modules_to_import.items():
-                if k not in self.modules_to_import:
-                    self.modules_to_import[k] = v
-                else:
-                    self.modules_to_import[k][1].update(v[1])
-            self.imported_modules.add(mod_name)
+def file_digests(files):
+    return {os.path.abspath(f): module_cache.digest(f) for f in sorted(files)}
 
-            for mod_name, d in iv.asts.items():
-                self.asts[mod_name].update(iv.asts[mod_name])
-        return node
+def invalidate(files=None):
+    # forget summaries of the given files, or all warm state if no files are given
+    module_cache.invalidate(files)
+    crawled_flows.clear()
+    # a created/deleted file can change how module names resolve
+    if files is None:
+        resolvers.clear()
+        directory_listings.clear()
+        project_graphs.clear()
+    for resolver in resolvers.values():
+        resolver.invalidate(files)
+    if files is not None:
+        for project in project_graphs.values():
+            project.update(files)
 
-class ArgsVisitor(ast.NodeVisitor):
-    def __init__(self):
-        self.res_string = []
-        self.res_pattern = ""
-        self.first_string = False
+def existence_changed(filepath):
+    # whether the file or one of its folders was created/deleted since the resolver listed it,
+    # folders which were never listed didn't take part in any import resolution
+    path = os.path.abspath(filepath)
+    parent = os.path.dirname(path)
+    while parent != path:
+        listing = directory_listings.get(parent)
+        if listing is not None and (os.path.basename(path) in listing) != os.path.exists(path):
+            return True
+        path, parent = parent, os.path.dirname(parent)
+    return False
 
-    def visit_Name(self, node):
-        if self.first_string:
-            self.res_string.append('([^/]+)')
-            self.res_pattern += 'v'
-    
-    def visit_Constant(self, node):
-        self.first_string = True
-        
-        constant = node.value
-        # normalize slashes
-        constant = constant.replace('\\', '/')
-        # remove initial slashes
-        while len(constant) and constant[0] == '/':
-            constant = constant[1:]
-        # remove final slashes
-        while len(constant) and constant[-1] == '/':
-            constant = constant[:-1]
-        self.res_string.append(constant)
+def is_stale(filepath, digest):
+    if not os.path.exists(filepath):
+        return True
+    try:
+        load_summary(filepath)
+    except (OSError, SyntaxError, ValueError):
+        return True
+    return module_cache.digest(filepath) != digest
 
-        self.res_pattern += 'c' * len(constant.split('/'))
+def parse_routes(routes):
+    for route in routes:
+        if "name" not in route:
+            continue
+        stripped = route["name"].strip(' /\\')
+        route["name"] = '/' + stripped + '/' if len(stripped) else '/'
+    return RouteIndex(routes)
 
-# NodeTransformer instead of NodeVisitor to mark nodes which reference a route
-class FunctionVisitor(ast.NodeTransformer):
-    def __init__(self, target_module, tracked_function, modules_to_import, already_visited, routes):
-        self.current_module = target_module # str
-        self.tracked_function = tracked_function
-        self.already_visited = already_visited # {"mod1": {"func1", "func2"}, "mod2": {func1, func2}}
-        self.modules_to_import = defaultdict(lambda: ("", set()), modules_to_import) # {"name": ("path", {"func1", "func2"})}
-        self.function_references = defaultdict(set)
-        self.routes = routes
+def request_routes(request):
+    # the routes given with a request, read from the project index file if it names one
+    if request.get("index") is not None:
+        return parse_routes(load_routes(request["index"]))
+    return parse_routes(request.get("routes", []))
 
-        # set current file path if not present
-        if self.current_module not in self.modules_to_import:
-            x = get_module_file(self.current_module)
-            assert x
-            self.modules_to_import[self.current_module] = (x, set())
+def in_packages(root, filepath):
+    # whether the file is imported from root as a module of packages, every folder below root has an __init__.py
+    folder = os.path.dirname(filepath)
+    while folder != root and os.path.dirname(folder) != folder:
+        if not os.path.exists(os.path.join(folder, "__init__.py")):
+            return False
+        folder = os.path.dirname(folder)
+    return True
 
+def flow_project(filepath, root=None):
+    # ("root", "module") a flow is analysed as: its project's root folder, which imports are resolved
+    # against, and the module name of the flow's file below it. Without a root, for a file outside of it,
+    # or for a file which isn't in packages below it, the flow's own folder is the root: like in a script,
+    # its imports find the modules next to it, which the root alone wouldn't
+    filepath = os.path.abspath(filepath)
+    if root is not None and is_project_file(os.path.abspath(root), filepath) and in_packages(os.path.abspath(root), filepath):
+        root = os.path.abspath(root)
+    else:
+        root = os.path.dirname(filepath)
+    return root, module_name(root, filepath)
 
-    def visit_Import(self, node):
-        for alias in node.names:
-            x = get_module_file(alias.name)
-            if x:
-                self.modules_to_import[alias.name] = (x, set())
-        return node
+def crawl_flow(filepath, target_func, routes=None, root=None):
+    # the crawl of the functions reachable from the flow's start function, with their calls
+    global proj_path
+    (proj_path, module) = flow_project(filepath, root)
+    crawl = FlowCrawl(proj_path, routes if routes is not None else RouteIndex([]), get_resolver(), load_summary)
+    return crawl.crawl(module, os.path.abspath(filepath), target_func)
 
-    def visit_ImportFrom(self, node):
-        if node.module is not None:
-            x = get_module_file(node.module)
-            if x:
-                self.modules_to_import[node.module] = (x, set(map(lambda x: x.asname if x.asname else x.name, node.names)))
-        return node
+def analyse_flow(filepath, target_func, routes=None, sink=None, limits=None, start=None, root=None):
+    # limits: {"max_depth", "max_nodes"} of the walk. start: ("module", "func_name") to walk from
+    # instead of the flow's start function, the flow's last crawl is reused for it while it's fresh.
+    # root: the folder of the flow's project, see flow_project
+    cache_before = module_cache.stats()
+    key = (os.path.abspath(filepath), target_func, root)
+    crawled = crawled_flows.get(key) if start is not None else None
+    if crawled is None or any(is_stale(f, digest) for (f, digest) in crawled[1].items()):
+        dependencies.clear()
+        with instrumentation.phase("crawl"):
+            crawl = crawl_flow(filepath, target_func, routes, root)
+        crawled = (crawl, file_digests(dependencies))
+        crawled_flows[key] = crawled
+    (crawl, digests) = crawled
+    (module, func) = start if start is not None else (flow_project(filepath, root)[1], target_func)
+    output = {}
+    graph = crawl.flow_graph(module, func, sink, **(limits or {}))
+    # a streamed graph was already passed to sink record by record, only its size is left
+    output["streamed" if sink is not None else "graph"] = graph
+    output["dependencies"] = digests
+    output["cache"] = {k: v - cache_before[k] for (k, v) in module_cache.stats().items()}
+    if limits:
+        output["limits"] = limits
+    return output
 
-    def visit_FunctionDef(self, node):
-        if node.name != self.tracked_function:
-            self.modules_to_import[self.current_module][1].add(node.name)
-        return self.generic_visit(node)
+def analyse_project_flow(filepath, target_func, routes=None, sink=None, limits=None, start=None, root=None):
+    # same as analyse_flow, but the flow is read from the call graph of the whole project,
+    # which is built on the first flow of the root and reused by its other flows and by expand requests
+    global proj_path
+    (proj_path, module) = flow_project(filepath, root)
+    cache_before = module_cache.stats()
 
-    def visit_Call(self, node):
-        if isinstance(node.func, ast.Name):
-            # Handle simple function calls like "foo()"
-            for k, v in self.modules_to_import.items():
-                if node.func.id in v[1]:
-                    self.function_references[k].add(node.func.id)
-            else:
-                # Only add if defined here
-                if node.func.id in self.modules_to_import[self.current_module][1]:
-                    self.function_references[self.current_module].add(node.func.id)
-        elif isinstance(node.func, ast.Attribute):
-            # Handle method calls like "obj.method()"
-            y = self._get_attribute_chain(node.func)
-            # handle requests.get/post/delete/put/head(...)
-            unp = ast.unparse(node)
-            route_types = [("requests." + pat) in unp for pat in ["get", "post", "delete", "put", "head"]]
-            if any(route_types):
-                av = ArgsVisitor()
-                if len(node.args):
-                    # url is always first argument
-                    av.visit(node.args[0])
-                else:
-                   for named_arg in node.keywords:
-                       if named_arg.arg == 'url':
-                           av.visit(named_arg.value)
-                           break
-                endpoint = '/' + '/'.join(av.res_string) + '/'
-                route_type_dict = {
-                    0: "GET",
-                    1: "POST",
-                    2: "DELETE",
-                    3: "PUT",
-                    4: "HEAD"
-                }
-                rt = "GET"
-                index = 0
-                for route_type in route_types:
-                    if route_type == True:
-                        rt = route_type_dict[index]
-                        break
-                    index += 1
-                for route in self.routes:
-                    if re.match(endpoint, route.get('name','')) and \
-                        av.res_pattern == route.get('route_pattern', '') and \
-                        rt in route.get('methods', []):
-                        # add endpoint as information to the node
-                        node.is_route = True
-                        node.route = route
-                        break
-                else:
-                    # Unknown/exterior route, show add dummy node in graph
-                    node.is_route = True
+    routes = routes if routes is not None else RouteIndex([])
+    project = project_graphs.get(proj_path)
+    if project is None or project.routes is not routes:
+        with instrumentation.phase("project_scan"):
+            project = ProjectGraph(proj_path, routes, get_resolver(), load_summary, load_summaries)
+        project_graphs[proj_path] = project
+    output = {}
+    (module, func) = start if start is not None else (module, target_func)
+    graph, files = project.flow_graph(module, func, sink, **(limits or {}))
+    output["streamed" if sink is not None else "graph"] = graph
+    output["dependencies"] = file_digests(files)
+    output["cache"] = {k: v - cache_before[k] for (k, v) in module_cache.stats().items()}
+    if limits:
+        output["limits"] = limits
+    return output
 
-            for k in self.modules_to_import.keys():
-                if y.startswith(k):
-                    func_name = y[len(k)+1:]
-                    self.modules_to_import[k][1].add(func_name)
-                    self.function_references[k].add(func_name)
-                    break
-            # else:
-                # assert False
-        return self.generic_visit(node)
+def request_limits(request):
+    # the limits of the walk given with a request, None without any
+    limits = {k: request[k] for k in ("max_depth", "max_nodes") if request.get(k) is not None}
+    return limits or None
 
-    def _get_attribute_chain(self, node):
-        if isinstance(node, ast.Name):
-            return node.id
-        elif isinstance(node, ast.Attribute):
-            return f"{self._get_attribute_chain(node.value)}.{node.attr}"
-        return None
+def delta_output(output, since):
+    # the output with the delta of its graph against since, a previous graph or its fingerprint,
+    # instead of the whole graph
+    output = dict(output)
+    output["delta"] = graph_delta(since, output.pop("graph"))
+    return output
 
+def previous_graph(previous):
+    # the graph or fingerprint in a previous output, e.g. read back from a file
+    if "graph" in previous:
+        return previous["graph"]
+    return previous.get("fingerprint", previous)
 
-def parse_routes(routes):
-    for route in routes:
-        if "name" not in route:
-            continue
-        stripped = route["name"].strip(' /\\')
-        route["name"] = '/' + stripped + '/' if len(stripped) else '/'
-    return routes
+def shipped_output(output, request):
+    # the output of a graph request, with only the delta of the graph if the request has "since",
+    # and with the graph's fingerprint if it asks for it
+    shipped = delta_output(output, request["since"]) if request.get("since") is not None else output
+    if request.get("fingerprint"):
+        shipped = {**shipped, "fingerprint": graph_fingerprint(output["graph"])}
+    return shipped
+
+def write_output(output, outstream):
+    # with instrumentation enabled the output gets the "stats" of the analysis
+    with instrumentation.phase("json"):
+        text = json.dumps(output)
+    if instrumentation.enabled:
+        output["stats"] = instrumentation.snapshot()
+        text = json.dumps(output)
+    print(text, file=outstream, flush=True)
 
-def lets_go(filepath, target_func, routes=[]):
+def stream_records(outstream, request_id=None):
+    # sink writing the records of a streamed graph as newline-delimited JSON
+    def sink(record):
+        if request_id is not None:
+            record["id"] = request_id
+        outstream.write(json.dumps(record) + '\n')
+    return sink
+
+def lets_go(filepath, target_func, routes=[], project=False, stream=False, limits=None, since=None, fingerprint=False, root=None):
+    # since: a previous output, graph or fingerprint, only the delta against it is written
+    instrumentation.reset()
     routes = parse_routes(routes)
-    path = Path(filepath)
-    current_filename = path.stem
-    
-    # TODO: maybe include more up the filepath
-    include_path = path.parent.absolute()
-    global proj_path
-    proj_path = str(include_path)
-    sys.path.append(str(include_path))
-    
-    with open(filepath, 'r') as f:
-        code = f.read()
-    tree = ast.parse(code)
-    walker = ImportVisitor(current_filename, {current_filename: {target_func}}, dict(), dict(), routes)
-    walker.visit(tree)
-    asts = walker.asts
-    modules = walker.modules_to_import
-    output = {}
-    interm = {"asts": []}
-    for mod_name, func_dict in asts.items():
-        for func_name, func_ast in func_dict.items():
-            interm_func = {"module": mod_name, "file": modules[mod_name][0], "func_name": func_name, "ast": func_ast}
-            interm["asts"].append(interm_func)
-    graph = create_graph(current_filename, target_func, interm["asts"])
-    output["graph"] = graph
-    print(json.dumps(output), file=sys.stdout, flush=True)
+    sink = stream_records(sys.stdout) if stream else None
+    output = (analyse_project_flow if project else analyse_flow)(filepath, target_func, routes, sink, limits, root=root)
+    module_cache.save()
+    if stream:
+        # the completion record
+        output = {"type": "done", **output}
+    else:
+        output = shipped_output(output, {"since": previous_graph(since) if since is not None else None, "fingerprint": fingerprint})
+    write_output(output, sys.stdout)
+
+def update_flows(files, state, delta=False):
+    # re-analyses the flows depending on the changed/created/deleted files,
+    # and returns only the flows whose graph actually changed, with the delta against
+    # the previous graph instead of the new graph if delta is set
+    files = {os.path.abspath(f) for f in files}
+    # a created/deleted file can change how imports resolve for any flow
+    moved = any(existence_changed(f) for f in files)
+    invalidate(files)
+    results = []
+    for (filepath, func, root), (project, output) in state["flows"].items():
+        if not moved and not any(is_stale(f, digest) for (f, digest) in output["dependencies"].items() if f in files):
+            continue
+        analyse = analyse_project_flow if project else analyse_flow
+        try:
+            new_output = analyse(filepath, func, state["routes"], limits=output.get("limits"), root=root)
+        except Exception as e:
+            # keep the last graph, the file might be in the middle of an edit
+            results.append({"file": filepath, "func": func, "error": str(e)})
+            continue
+        state["flows"][(filepath, func, root)] = (project, new_output)
+        # the ids of the nodes are their positions in the walk, they move without anything else changing
+        if graph_fingerprint(new_output["graph"]) != graph_fingerprint(output["graph"]):
+            results.append({"file": filepath, "func": func, **(delta_output(new_output, output["graph"]) if delta else new_output)})
+    module_cache.save()
+    return results
+
+def track_flow(state, request, project, output):
+    # remembers the flow's last graph for "update", one per flow: the client keeps the graph it got last,
+    # so a graph of the flow in the other mode replaces the one it had
+    state["flows"][(os.path.abspath(request["file"]), request["func"], request.get("root"))] = (project, output)
+
+def handle_request(request, state):
+    cmd = request.get("cmd", "graph")
+    if cmd == "graph":
+        project = bool(request.get("project"))
+        analyse = analyse_project_flow if project else analyse_flow
+        if "flows" in request:
+            results = []
+            for flow in request["flows"]:
+                try:
+                    output = analyse(flow["file"], flow["func"], state["routes"], limits=request_limits(flow), root=flow.get("root"))
+                    track_flow(state, flow, project, output)
+                    results.append(shipped_output(output, flow))
+                except Exception as e:
+                    results.append({"error": str(e)})
+            module_cache.save()
+            return {"results": results}
+        if request.get("stream"):
+            # records go out while the graph is walked, the response is the completion record.
+            # Streamed flows aren't remembered for "update", their graphs are never kept
+            sink = stream_records(state["outstream"], request.get("id"))
+            output = analyse(request["file"], request["func"], state["routes"], sink, request_limits(request), root=request.get("root"))
+            module_cache.save()
+            return {"type": "done", **output}
+        output = analyse(request["file"], request["func"], state["routes"], limits=request_limits(request), root=request.get("root"))
+        track_flow(state, request, project, output)
+        module_cache.save()
+        return shipped_output(output, request)
+    if cmd == "expand":
+        # the graph below a node of a flow's graph, the flow's crawl or project graph is reused
+        analyse = analyse_project_flow if request.get("project") else analyse_flow
+        node = request["node"]
+        limits = request_limits({"max_depth": request.get("depth", 1), "max_nodes": request.get("max_nodes")})
+        start = (node["module"], node["func_name"])
+        sink = stream_records(state["outstream"], request.get("id")) if request.get("stream") else None
+        output = analyse(request["file"], request["func"], state["routes"], sink, limits, start, request.get("root"))
+        module_cache.save()
+        return {"type": "done", **output} if sink is not None else output
+    if cmd == "update":
+        return {"results": update_flows(request.get("files", []), state, bool(request.get("delta")))}
+    if cmd == "routes":
+        routes = request_routes(request)
+        if routes.routes != state["routes"].routes:
+            # the graphs are for the old routes
+            state["routes"] = routes
+            state["flows"].clear()
+        return {"ok": True}
+    if cmd == "invalidate":
+        invalidate(request.get("files"))
+        return {"ok": True}
+    if cmd == "reload":
+        invalidate()
+        state["flows"].clear()
+        if "routes" in request or "index" in request:
+            state["routes"] = request_routes(request)
+        return {"ok": True}
+    if cmd == "shutdown":
+        state["running"] = False
+        return {"ok": True}
+    raise ValueError(f"Unknown command '{cmd}'")
+
+def serve(routes=[], instream=sys.stdin, outstream=sys.stdout):
+    # line-delimited JSON protocol, one request per line and one response per line:
+    #   {"id": 1, "cmd": "routes", "routes": [...]}
+    #   {"id": 1, "cmd": "routes", "index": "path"}  (the routes of a project_index.py index file)
+    #   {"id": 2, "cmd": "graph", "file": "...", "func": "..."}
+    #   {"id": 3, "cmd": "graph", "flows": [{"file": "...", "func": "..."}, ...]}
+    #   graph requests with "project": true read the flows from the call graph of the whole project
+    #   requests and flows can have the "root" folder of the flow's project, imports are resolved against it
+    #   and all flows with the same root share one project graph. By default, and for flow files which
+    #   aren't in packages below the root, the flow file's folder is the root
+    #   single flow graph requests with "stream": true answer with node/edge/dotted_edge records
+    #   carrying the request id, followed by a {"type": "done"} response with the record counts
+    #   graph requests and flows can have "max_depth" and "max_nodes" limits, the functions whose
+    #   calls were left out are marked "expandable"
+    #   {"id": 8, "cmd": "expand", "file": "...", "func": "...", "node": {"module": "...", "func_name": "..."}, "depth": 1}
+    #   answers the graph `depth` levels below the node, to be merged into the flow's graph
+    #   ("project", "root", "max_nodes" and "stream" as for graph requests)
+    #   {"id": 4, "cmd": "invalidate", "files": ["..."]}  (no "files" drops everything)
+    #   {"id": 7, "cmd": "update", "files": ["..."]}  (changed/created/deleted files)
+    # update answers {"results": [...]} with only the previously generated flows whose graph changed,
+    # each result has "file", "func" and the new "graph" or an "error". With "delta": true the
+    # results have the "delta" against the previous graph instead, see create_graph.graph_delta.
+    # A flow has one result, for the mode ("project" or not) it was last generated in
+    #   non-streamed graph requests and flows with "since": previous graph or fingerprint answer the
+    #   "delta" against it instead of the "graph", with "fingerprint": true they also carry the
+    #   fingerprint of the new graph
+    #   {"id": 5, "cmd": "reload", "routes": [...]}  (or "index")
+    #   {"id": 6, "cmd": "shutdown"}
+    # responses echo the request id and carry either the result or an "error",
+    # and the "stats" of the request when instrumentation is enabled
+    state = {"routes": parse_routes(routes), "flows": dict(), "running": True, "outstream": outstream} # "flows": {("file", "func", "root"): (project, output)}
+    for line in instream:
+        line = line.strip()
+        if not line:
+            continue
+        request = {}
+        instrumentation.reset()
+        try:
+            request = json.loads(line)
+            response = handle_request(request, state)
+        except Exception as e:
+            response = {"error": str(e)}
+        response["id"] = request.get("id") if isinstance(request, dict) else None
+        write_output(response, outstream)
+        if not state["running"]:
+            break
 
 sample_routes = [] # insert sample_routes json object to debug manually
-try:
-    argc = len(sys.argv)
-    # print(sys.argv, argc)
-    if argc < 3:
-        filepath = "" # insert sample filepath to debug manually
-        func_name = "" # insert sample function_name to debug manually
-        # lets_go(filepath, func_name, routes=sample_routes) # uncomment
-    else:
-        filepath = sys.argv[1]
-        func_name = sys.argv[2]
-        routes = []
-        if argc == 4:
-            routes = json.loads(sys.argv[3])
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the call graph of a flow starting from a python function")
+    parser.add_argument("filepath", nargs='?', default="") # insert sample filepath to debug manually
+    parser.add_argument("func_name", nargs='?', default="") # insert sample function_name to debug manually
+    parser.add_argument("routes", nargs='?', default=None, help="JSON list of the routes, prefer --index for large projects")
+    parser.add_argument("--index", default=None, help="read the routes from an index file written by project_index.py")
+    parser.add_argument("--server", action="store_true", help="answer line-delimited JSON requests from stdin")
+    parser.add_argument("--project", action="store_true", help="build the call graph of the whole project and read the flow from it")
+    parser.add_argument("--root", default=None, help="root folder of the flow's project, imports are resolved against it, by default and for files which aren't in packages below it the flow file's folder")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes summarizing modules of a project in parallel, 0 uses all cores")
+    parser.add_argument("--cache-dir", default=None, help="directory to keep parsed module summaries in between runs")
+    parser.add_argument("--stream", action="store_true", help="write the graph as newline-delimited JSON records while it is walked")
+    parser.add_argument("--max-depth", type=int, default=None, help="only walk the functions less than this many calls away from the start function")
+    parser.add_argument("--max-nodes", type=int, default=None, help="only walk functions while the graph has at most this many function nodes")
+    parser.add_argument("--since", default=None, help="JSON file with a previous output, graph or fingerprint, only the delta against it is written")
+    parser.add_argument("--fingerprint", action="store_true", help="add the fingerprint of the graph to the output, to compute later deltas against")
+    parser.add_argument("--stats", action="store_true", default=bool(os.environ.get("FLOW_DOC_STATS")), help="add per phase times and counters to the output, also enabled by FLOW_DOC_STATS=1")
+    parser.add_argument("--profile", default=os.environ.get("FLOW_DOC_PROFILE"), help="write cProfile stats of the whole run to this file, readable with pstats")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="maximum size of the cache directory in MB")
+    args = parser.parse_args()
+    instrumentation.enabled = args.stats
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+        if args.cache_dir is not None:
+            module_cache = ModuleCache(args.cache_dir, args.cache_size * 1024 * 1024, SUMMARY_VERSION, lazy_functions)
+        if args.index is not None:
+            routes = load_routes(args.index)
         else:
-            routes = sample_routes
-        lets_go(filepath, func_name, routes=routes)
-except Exception as e:
-    print(e, file=sys.stderr, flush=True)
-    raise(e)
+            routes = json.loads(args.routes) if args.routes is not None else sample_routes
+        if args.server:
+            serve(routes)
+        elif args.filepath and args.func_name:
+            limits = request_limits({"max_depth": args.max_depth, "max_nodes": args.max_nodes})
+            since = None
+            if args.since is not None:
+                with open(args.since) as f:
+                    since = json.load(f)
+            lets_go(args.filepath, args.func_name, routes=routes, project=args.project, stream=args.stream, limits=limits, since=since, fingerprint=args.fingerprint, root=args.root)
+        # else:
+            # lets_go(filepath, func_name, routes=sample_routes) # uncomment
+    except Exception as e:
+        print(e, file=sys.stderr, flush=True)
+        raise(e)
+    finally:
+        shutdown_executor()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)